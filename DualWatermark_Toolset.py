@@ -2,19 +2,74 @@ import cv2
 import numpy as np
 from tkinter import *
 from tkinter import filedialog, colorchooser, messagebox, ttk
-from PIL import Image, ImageTk, ImageFont, ImageDraw
+from PIL import Image, ImageTk, ImageDraw
 from pathlib import Path
-import base64
-import io
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad, unpad
-from Crypto.Random import get_random_bytes
-import qrcode
 import logging
-import os
+import queue
+import threading
+import time
 from datetime import datetime
+import watermark_core as core
+import asset_cache
+import batch_engine
+import compositor
+import steganalysis
+import tiled
+from preview import PROXY_MAX_SIDE, PreviewPyramid, make_proxy
+from live_preview import LiveRenderer
+from lsb_engine import (FLAG_IMAGE, MAX_DEPTH, ExtractionCancelled, capacity_bytes, check_cancel, embed_container,
+                        expected_psnr, extract_payload, psnr, required_depth)
+
+# 預覽停止變動多久後以 LANCZOS 精修（毫秒）
+REFINE_DELAY_MS = 300
+# 背景重繪結果的輪詢間隔（毫秒）
+LIVE_POLL_MS = 30
+# 背景讀取 LSB 時的進度輪詢間隔（毫秒）
+EXTRACT_POLL_MS = 50
+
+
+class ProgressWindow:
+    """背景工作與批次處理共用的進度視窗：訊息、進度條、狀態列與取消按鈕；
+    按下取消或關閉視窗時設定 cancel（threading.Event）"""
+
+    def __init__(self, root, title, message, status=None, bar=True, geometry="400x170"):
+        self.window = Toplevel(root)
+        self.window.title(title)
+        self.window.geometry(geometry)
+        self.label = Label(self.window, text=message)
+        self.label.pack(pady=10)
+        self.bar = None
+        if bar:
+            self.bar = ttk.Progressbar(self.window, orient="horizontal", length=350, mode="determinate")
+            self.bar.pack(pady=5)
+        self.status = None
+        if status is not None:
+            self.status = Label(self.window, text=status)
+            self.status.pack(pady=5)
+        self.cancel = threading.Event()
+        Button(self.window, text="取消", command=self.request_cancel).pack(pady=5)
+        self.window.protocol("WM_DELETE_WINDOW", self.request_cancel)
+
+    def request_cancel(self):
+        self.cancel.set()
+        self.label.config(text="正在取消...")
+
+    def show(self, message=None, status=None, fraction=None):
+        """更新訊息、狀態列與進度（0~1）；取消後保留「正在取消」的訊息"""
+        if message is not None and not self.cancel.is_set():
+            self.label.config(text=message)
+        if status is not None and self.status is not None:
+            self.status.config(text=status)
+        if fraction is not None and self.bar is not None:
+            self.bar["value"] = fraction * 100
+
+    def update(self):
+        """處理視窗事件，供主執行緒上的批次迴圈（及其 on_idle）呼叫"""
+        self.window.update()
+
+    def close(self):
+        self.window.destroy()
 
-SENTINEL = '1111111111111110'
 
 class WatermarkApp:
     def apply_all_watermarks(self):
@@ -24,91 +79,133 @@ class WatermarkApp:
 
         try:
             # 取得參數
-            fs, a, x, y = map(lambda e: int(e.get()), [self.font_size, self.alpha, self.pos_x, self.pos_y])
+            params = self.read_params()
         except Exception as e:
             self.log_action("套用全部浮水印", "失敗", f"參數解析錯誤: {str(e)}")
             return messagebox.showwarning("格式錯誤", "請輸入數字")
-            
-        text = self.text_entry.get().strip()
-        base = Image.fromarray(self.image).convert("RGBA")
-        overlay = Image.new("RGBA", base.size, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(overlay)
-        
-        try:
-            font = ImageFont.truetype(self.font_path, fs) if self.font_path and Path(self.font_path).exists() else ImageFont.load_default()
-        except Exception as e:
-            self.log_action("套用全部浮水印", "警告", f"字型載入失敗: {str(e)}")
-            font = ImageFont.load_default()
-            
-        # 套用文字浮水印
-        if text:
-            draw.text((x, y), text, font=font, fill=self.color + (a,))
-            self.log_action("套用全部浮水印", "成功", "已套用文字浮水印")
-
-        # 套用圖片浮水印
-        if self.wm_image_path:
-            try:
-                wm = Image.open(self.wm_image_path).convert("RGBA")
-                
-                # 智能縮放浮水印圖片
-                base_w, base_h = base.size
-                wm_w, wm_h = wm.size
-                
-                # 限制浮水印大小不超過主圖的 1/4
-                max_w = base_w / 4
-                max_h = base_h / 4
-                
-                if wm_w > max_w or wm_h > max_h:
-                    scale = min(max_w / wm_w, max_h / wm_h)
-                    wm = wm.resize((int(wm_w * scale), int(wm_h * scale)), Image.LANCZOS)
-                
-                # 調整透明度
-                if a < 255:
-                    r, g, b, alpha = wm.split()
-                    alpha = alpha.point(lambda i: int(i * (a / 255)))
-                    wm.putalpha(alpha)
-                    
-                # 圖片位置偏移，避免與文字重疊
-                wm_pos = (x + 50, y + 50)
-                overlay.paste(wm, wm_pos, wm)
-                self.log_action("套用全部浮水印", "成功", "已套用圖片浮水印")
-            except Exception as e:
-                self.log_action("套用全部浮水印", "警告", f"圖片浮水印處理失敗: {str(e)}")
-
-        # 套用 QR code
-        if text:
-            try:
-                qr = qrcode.make(text)
-                qr = qr.convert("RGBA").resize((fs * 3, fs * 3), Image.LANCZOS)
-                
-                # 調整透明度
-                if a < 255:
-                    r, g, b, alpha = qr.split()
-                    alpha = alpha.point(lambda i: int(i * (a / 255)))
-                    qr.putalpha(alpha)
-                    
-                # 放在右下角
-                base_w, base_h = base.size
-                qr_pos = (base_w - qr.width - 20, base_h - qr.height - 20)
-                overlay.paste(qr, qr_pos, qr)
-                self.log_action("套用全部浮水印", "成功", "已套用QR碼浮水印")
-            except Exception as e:
-                self.log_action("套用全部浮水印", "警告", f"QR碼處理失敗: {str(e)}")
 
-        # 合併所有浮水印
-        merged = Image.alpha_composite(base, overlay)
-        self.preview_image = np.array(merged.convert("RGB"))
+        log = lambda status, details: self.log_action("套用全部浮水印", status, details)
+        self.render_preview(self._watermark_render("all", params, log))
+        self.live_op, self.live_params = "all", params
         self.display_image()
         self.log_action("套用全部浮水印", "成功", "已完成所有浮水印套用")
         
         # 顯示成功提示
         messagebox.showinfo("完成", "已套用全部浮水印")
+
+    def _render_target(self):
+        """回傳預覽要繪製的影像與原圖尺寸；非代理模式時原圖尺寸為 None"""
+        if self.tiled_reader is not None:
+            # 大型圖片只保留縮圖，一律當作代理影像預覽
+            return self.image, (self.tiled_reader.width, self.tiled_reader.height)
+        if self.proxy_mode.get() and self.proxy_image is not None and self.proxy_image is not self.image:
+            return self.proxy_image, (self.image.shape[1], self.image.shape[0])
+        return self.image, None
+
+    def render_preview(self, render):
+        """代理模式下在縮小的代理影像上套用浮水印，並保留 render 供儲存時以原圖解析度輸出"""
+        self.live_renderer.cancel()  # 背景中尚未完成的即時重繪已過時
+        image, full_size = self._render_target()
+        self._set_preview(*render(image, full_size), base=image)
+        self.pending_render = render if full_size else None
+
+    def _set_preview(self, image, bbox=None, base=None):
+        """換上新的預覽影像並記錄金字塔須重算的範圍：與目前預覽畫在同一張底圖上時，
+        只有新舊浮水印的外框內會變動，否則整張重算"""
+        if base is None or base is not self._preview_base:
+            self._pyramid_stale = True
+        else:
+            self._pyramid_dirty = compositor.union_bbox(self._pyramid_dirty,
+                                                        compositor.union_bbox(self.preview_bbox, bbox))
+        self.preview_image, self.preview_bbox, self._preview_base = image, bbox, base
+
+    def _watermark_render(self, op, params, log=None):
+        """回傳套用指定種類浮水印的 render(image, full_size)，結果為 (影像, 浮水印外框)"""
+        wm = (self.wm_image_path or None) if op in ("image", "all") else None
+        return lambda image, full_size: core.render_watermark(image, op, params, wm, log, full_size)
+
+    def schedule_live_render(self, event=None):
+        """參數變動後在背景重繪最近套用的浮水印；連續輸入只重繪最後一次"""
+        if not self.live_mode.get() or self.image is None or self.live_op is None:
+            return
+        try:
+            params = self.read_params()
+        except ValueError:
+            return  # 數字尚未輸入完成，等下一次變動
+        if self.live_op == "qrcode":
+            params.text = params.text.strip()
+            if not params.text:
+                return
+
+        # 背景執行緒不可操作 Tk，因此不傳入 log_action，由核心模組的 logger 紀錄
+        render = self._watermark_render(self.live_op, params)
+        image, full_size = self._render_target()
+        self.live_renderer.submit(lambda: (render(image, full_size), render if full_size else None, params, image))
+        if not self._live_polling:
+            self._live_polling = True
+            self.root.after(LIVE_POLL_MS, self._poll_live_render)
+
+    def _poll_live_render(self):
+        """在主執行緒取回最新的重繪結果並更新畫布"""
+        item = self.live_renderer.latest()
+        if item is not None:
+            _, result, error = item
+            if error is not None:
+                self.log_action("即時預覽", "失敗", str(error))
+            else:
+                (preview, bbox), self.pending_render, self.live_params, base = result
+                self._set_preview(preview, bbox, base)
+                self.display_image()
+        if self.live_renderer.busy or not self.live_renderer.results.empty():
+            self.root.after(LIVE_POLL_MS, self._poll_live_render)
+        else:
+            self._live_polling = False
+
+    def _show_original(self):
+        """顯示未加浮水印的圖片（代理模式下顯示代理影像）"""
+        self.render_preview(lambda image, full_size: (image.copy(), None))
+        self.live_op = None
+
+    def _toggle_proxy_mode(self):
+        if self.pending_render is not None and not self.proxy_mode.get() and self.tiled_reader is None:
+            self._set_preview(*self.pending_render(self.image, None), base=self.image)
+            self.pending_render = None
+            self.display_image()
+        self.log_action("代理預覽", "資訊", "開啟" if self.proxy_mode.get() else "關閉")
+
+    def read_params(self):
+        """由輸入欄位讀取浮水印參數"""
+        fs, a, x, y = map(lambda e: int(e.get()), [self.font_size, self.alpha, self.pos_x, self.pos_y])
+        return core.WatermarkParams(text=self.text_entry.get(), font_path=self.font_path,
+                                    font_size=fs, alpha=a, x=x, y=y, color=self.color)
+
     def __init__(self, root):
         self.root, self.image, self.preview_image = root, None, None
         self.image_path, self.wm_image_path = "", ""
         self.font_path = str(Path(__file__).parent / "NotoSansCJK-Regular.ttf")
         self.color = (0, 0, 0)
         self.original_image = None  # 保存原始圖像以便重置
+        self.batch_workers = None  # 批次處理的工作程序數，None 表示使用全部 CPU 核心
+        self.pyramid = None  # 預覽用縮圖金字塔
+        self.preview_bbox = None  # 目前預覽上浮水印的外框
+        self._preview_base = None  # 目前預覽所依據的底圖
+        self._pyramid_dirty = None  # 金字塔尚未重算的變動範圍
+        self._pyramid_stale = True  # 預覽換了底圖，金字塔須整張重算
+        self.proxy_image = None  # 編輯時使用的縮小代理影像
+        self.pending_render = None  # 代理模式下儲存時以原圖解析度重新輸出的函式
+        self.proxy_mode = BooleanVar(value=True)
+        self._refine_job = None
+        self.live_op = None  # 最近套用的浮水印種類，參數變動時以此自動重繪
+        self.live_params = None  # 最近一次繪製預覽時的參數
+        self.tiled_reader = None  # 大型圖片的條帶讀取器，此時 self.image 只是縮圖
+        self.inplace_mode = BooleanVar(value=False)  # 未壓縮格式只改寫資料涵蓋的位元組
+        self.compress_mode = BooleanVar(value=True)  # 嵌入前先壓縮資料，自動選擇最小的格式
+        self.lsb_depth = IntVar(value=1)  # 資料區每個通道使用的最低位元數
+        self.scatter_mode = BooleanVar(value=False)  # 依密鑰把資料分散到整張圖片
+        self._capacity_job = None
+        self.live_mode = BooleanVar(value=True)
+        self.live_renderer = LiveRenderer()
+        self._live_polling = False
         
         root.title("影像處理期末專題 - 浮水印工具")
 
@@ -156,6 +253,9 @@ class WatermarkApp:
         self.pos_y = Entry(ctrl, width=20); self.pos_y.insert(0, "50"); self.pos_y.grid(row=4, column=1, padx=5, pady=2)
         Label(ctrl, text="不可見浮水印文字").grid(row=5, column=0, sticky="e", padx=5, pady=2)
         self.hidden_text = Entry(ctrl, width=20); self.hidden_text.grid(row=5, column=1, padx=5, pady=2)
+        # 浮水印參數變動時即時重繪
+        for entry in (self.text_entry, self.font_size, self.alpha, self.pos_x, self.pos_y):
+            entry.bind("<KeyRelease>", self.schedule_live_render)
         
         # 顏色選擇和顯示
         color_frame = Frame(ctrl)
@@ -173,6 +273,7 @@ class WatermarkApp:
         self.font_preview = Label(font_frame, text="字型預覽 Aa 中文", height=2)
         self.font_preview.pack(fill=X, pady=2)
         self._update_font_preview()  # 初始化字型預覽
+        self.preload_font()
 
         Label(ctrl, text="加密密鑰(16字)").grid(row=6, column=0, sticky="e", padx=5, pady=2)
         self.aes_key_entry = Entry(ctrl, width=20); self.aes_key_entry.grid(row=6, column=1, padx=5, pady=2)
@@ -182,6 +283,7 @@ class WatermarkApp:
         self.lsb_capacity_frame.grid(row=6, column=2, padx=5, pady=2)
         self.lsb_capacity_label = Label(self.lsb_capacity_frame, text="LSB 容量: 0 bytes")
         self.lsb_capacity_label.pack()
+        self.hidden_text.bind("<KeyRelease>", self.schedule_capacity_update)
 
         # 文件操作按鈕區
         file_frame = LabelFrame(right_panel, text="檔案操作")
@@ -200,6 +302,10 @@ class WatermarkApp:
         Button(watermark_frame, text="套用圖片浮水印", command=self.apply_image_watermark).grid(row=0, column=1, padx=2, pady=2, sticky="ew")
         Button(watermark_frame, text="套用QR碼浮水印", command=self.apply_qrcode_watermark).grid(row=0, column=2, padx=2, pady=2, sticky="ew")
         Button(watermark_frame, text="套用全部浮水印", command=self.apply_all_watermarks).grid(row=0, column=3, padx=2, pady=2, sticky="ew")
+        Checkbutton(watermark_frame, text="代理預覽（儲存時輸出原圖解析度）", variable=self.proxy_mode,
+                    command=self._toggle_proxy_mode).grid(row=1, column=0, columnspan=4, sticky="w")
+        Checkbutton(watermark_frame, text="即時預覽（參數變動時自動重繪）", variable=self.live_mode,
+                    command=self.schedule_live_render).grid(row=2, column=0, columnspan=4, sticky="w")
         
         # LSB 操作按鈕區
         lsb_frame = LabelFrame(right_panel, text="LSB 隱寫操作")
@@ -209,8 +315,20 @@ class WatermarkApp:
         Button(lsb_frame, text="讀取LSB", command=self.extract_lsb).grid(row=0, column=1, padx=2, pady=2, sticky="ew")
         Button(lsb_frame, text="嵌入圖片LSB", command=self.embed_lsb_image).grid(row=0, column=2, padx=2, pady=2, sticky="ew")
         Button(lsb_frame, text="讀出圖片LSB", command=self.extract_lsb_image).grid(row=0, column=3, padx=2, pady=2, sticky="ew")
-        Button(lsb_frame, text="顯示LSB差異", command=self.show_lsb_difference).grid(row=1, column=0, columnspan=2, padx=2, pady=2, sticky="ew")
+        Button(lsb_frame, text="顯示LSB差異", command=self.show_lsb_difference).grid(row=1, column=0, padx=2, pady=2, sticky="ew")
+        Button(lsb_frame, text="LSB盲偵測", command=self.analyze_lsb_statistics).grid(row=1, column=1, padx=2, pady=2, sticky="ew")
         Button(lsb_frame, text="批次浮水印", command=self.batch_apply_watermarks).grid(row=1, column=2, columnspan=2, padx=2, pady=2, sticky="ew")
+        Checkbutton(lsb_frame, text="原地嵌入（BMP/PPM/未壓縮 TIFF，保留原格式）",
+                    variable=self.inplace_mode).grid(row=2, column=0, columnspan=4, sticky="w")
+        Checkbutton(lsb_frame, text="壓縮資料（自動選擇最小的壓縮格式）", variable=self.compress_mode,
+                    command=self.update_lsb_capacity).grid(row=3, column=0, columnspan=4, sticky="w")
+        Label(lsb_frame, text="嵌入深度（bits/通道）").grid(row=4, column=0, columnspan=2, sticky="e", padx=2)
+        OptionMenu(lsb_frame, self.lsb_depth, *range(1, MAX_DEPTH + 1),
+                   command=lambda _: self.update_lsb_capacity()).grid(row=4, column=2, sticky="w", padx=2)
+        Checkbutton(lsb_frame, text="依密鑰分散嵌入位置（讀取時需要相同密鑰）",
+                    variable=self.scatter_mode).grid(row=5, column=0, columnspan=4, sticky="w")
+        Button(lsb_frame, text="批次LSB嵌入（清單檔）", command=self.batch_embed_lsb).grid(row=6, column=0, columnspan=2, padx=2, pady=2, sticky="ew")
+        Button(lsb_frame, text="掃描資料夾LSB", command=self.scan_lsb_folder).grid(row=6, column=2, columnspan=2, padx=2, pady=2, sticky="ew")
         
         # 狀態列
         self.status_bar = Label(root, text="就緒", bd=1, relief=SUNKEN, anchor=W)
@@ -270,26 +388,16 @@ class WatermarkApp:
             return messagebox.showwarning("警告", "請先載入圖片")
         
         try:
-            fs, a, x, y = map(lambda e: int(e.get()), [self.font_size, self.alpha, self.pos_x, self.pos_y])
+            params = self.read_params()
         except Exception as e:
             self.log_action("套用文字浮水印", "失敗", f"參數解析錯誤: {str(e)}")
             return messagebox.showwarning("格式錯誤", "請輸入數字")
 
-        img_pil = Image.fromarray(self.image).convert("RGBA")
-        overlay = Image.new("RGBA", img_pil.size, (255,255,255,0))
-        draw = ImageDraw.Draw(overlay)
-        text = self.text_entry.get()
-        
-        try:
-            font = ImageFont.truetype(self.font_path, fs) if self.font_path and Path(self.font_path).exists() else ImageFont.load_default()
-        except Exception as e:
-            self.log_action("套用文字浮水印", "警告", f"字型載入失敗: {str(e)}")
-            font = ImageFont.load_default()
-        
-        draw.text((x, y), text, font=font, fill=self.color + (a,))
-        self.preview_image = np.array(Image.alpha_composite(img_pil, overlay).convert("RGB"))
+        log = lambda status, details: self.log_action("套用文字浮水印", status, details)
+        self.render_preview(self._watermark_render("text", params, log))
+        self.live_op, self.live_params = "text", params
         self.display_image()
-        self.log_action("套用文字浮水印", "成功", f"文字: {text}, 位置: ({x}, {y}), 大小: {fs}")
+        self.log_action("套用文字浮水印", "成功", f"文字: {params.text}, 位置: ({params.x}, {params.y}), 大小: {params.font_size}")
 
     def apply_qrcode_watermark(self):
         if self.image is None:
@@ -302,23 +410,15 @@ class WatermarkApp:
             return messagebox.showwarning("警告", "請輸入文字來產生 QR code")
         
         try:
-            fs, a, x, y = map(lambda e: int(e.get()), [self.font_size, self.alpha, self.pos_x, self.pos_y])
+            params = self.read_params()
+            params.text = text
         except Exception as e:
             self.log_action("套用QR碼浮水印", "失敗", f"參數解析錯誤: {str(e)}")
             return messagebox.showwarning("格式錯誤", "請輸入數字")
         
         try:
-            qr = qrcode.make(text)
-            qr = qr.convert("RGBA").resize((fs * 3, fs * 3), Image.LANCZOS)
-            if a < 255:
-                r, g, b, alpha = qr.split()
-                alpha = alpha.point(lambda i: int(i * (a / 255)))
-                qr.putalpha(alpha)
-            base = Image.fromarray(self.image).convert("RGBA")
-            base_w, base_h = base.size
-            qr_pos = (base_w - qr.width - 20, base_h - qr.height - 20)
-            base.paste(qr, qr_pos, qr)
-            self.preview_image = np.array(base.convert("RGB"))
+            self.render_preview(self._watermark_render("qrcode", params))
+            self.live_op, self.live_params = "qrcode", params
             self.display_image()
             self.log_action("套用QR碼浮水印", "成功", f"QR內容: {text}, 位置: 右下角")
         except Exception as e:
@@ -334,7 +434,11 @@ class WatermarkApp:
     def load_image(self):
         path = filedialog.askopenfilename()
         if path:
+            if tiled.is_large(path):
+                return self._load_large_image(path)
+
             self.image_path = path
+            self.tiled_reader = None
             img = cv2.imread(path)
             if img is None:
                 self.log_action("載入圖片", "失敗", f"無法載入 {path}")
@@ -342,37 +446,84 @@ class WatermarkApp:
                 self.image = None
                 self.update_lsb_capacity()
                 return messagebox.showerror("錯誤", "無法載入圖片")
-            
-            self.image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            self.original_image = self.image.copy()  # 保存原始圖像
-            self.preview_image = self.image.copy()
-            self.display_image()
-            
-            # 更新路徑顯示
-            self.main_image_path_label.config(text=str(Path(path).name), fg="blue")
-            
-            # 更新 LSB 容量預測
-            self.update_lsb_capacity()
-            
-            self.log_action("載入圖片", "成功", path)
+            self._set_image(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), path)
+
+    def _load_large_image(self, path):
+        """大型圖片只在背景逐條帶產生縮圖，套用浮水印與 LSB 嵌入時再以條帶處理原圖"""
+        try:
+            reader = tiled.StripReader(path)
+        except Exception as e:
+            self.log_action("載入圖片", "失敗", f"無法載入 {path}: {str(e)}")
+            return messagebox.showerror("錯誤", "無法載入圖片")
+
+        def done(preview, error):
+            if isinstance(error, ExtractionCancelled):
+                return self.log_action("載入圖片", "取消", path)
+            if error is not None:
+                self.log_action("載入圖片", "失敗", f"無法載入 {path}: {str(error)}")
+                return messagebox.showerror("錯誤", f"無法載入圖片: {str(error)}")
+            self.image_path = path
+            self.tiled_reader = reader
+            self._set_image(preview, path)
+            self.log_action("載入圖片", "資訊", f"大型圖片 {reader.width} x {reader.height}，以分塊模式處理")
+
+        self.run_background("正在載入大型圖片", lambda progress, cancel: tiled.load_preview(reader, PROXY_MAX_SIDE, progress, cancel),
+                            done, message="正在產生縮圖...")
+
+    def _set_image(self, image, path):
+        """換上新載入的主圖並更新預覽與容量顯示"""
+        self.image = image
+        self.original_image = self.image.copy()  # 保存原始圖像
+        self.proxy_image = make_proxy(self.image)
+        self._show_original()
+        self.pyramid = PreviewPyramid(self.preview_image)
+        self.display_image()
+        
+        # 更新路徑顯示
+        self.main_image_path_label.config(text=str(Path(path).name), fg="blue")
+        
+        # 更新 LSB 容量預測
+        self.update_lsb_capacity()
+        
+        self.log_action("載入圖片", "成功", path)
 
     def update_lsb_capacity(self):
         """更新 LSB 容量顯示標籤"""
         if self.image is not None:
-            if hasattr(self.image, "shape"):
-                height, width, channels = self.image.shape
-                total_bits = height * width * channels
-                total_bytes = total_bits // 8
-                self.lsb_capacity_label.config(text=f"LSB 容量: {total_bytes} bytes")
+            # 大型圖片以原圖尺寸計算，而不是縮圖
+            carrier = self.tiled_reader if self.tiled_reader is not None else self.image
+            if hasattr(carrier, "shape"):
+                depth = self.lsb_depth.get()
+                total_bytes = capacity_bytes(carrier, depth)
+                summary = (f"LSB 容量: {total_bytes} bytes（{depth} bit/通道，"
+                           f"填滿時 PSNR 約 {expected_psnr(carrier, total_bytes, depth):.1f} dB）")
+                text = self.hidden_text.get()
+                if text:
+                    # 以目前訊息的壓縮加密比例估算可嵌入的原文長度
+                    raw, packed = core.lsb_text_size(text, self.compress_mode.get())
+                    effective = total_bytes * raw // packed
+                    summary += (f"\n目前訊息 {raw}→{packed} bytes，PSNR 約 {expected_psnr(carrier, packed, depth):.1f} dB，"
+                                f"有效容量約 {effective} bytes")
+                self.lsb_capacity_label.config(text=summary)
             else:
                 self.lsb_capacity_label.config(text="LSB 容量: 0 bytes")
         else:
             self.lsb_capacity_label.config(text="LSB 容量: 0 bytes")
     
+    def schedule_capacity_update(self, event=None):
+        """輸入隱藏文字時延遲更新容量顯示，避免每次按鍵都壓縮一次"""
+        if self._capacity_job is not None:
+            self.root.after_cancel(self._capacity_job)
+        self._capacity_job = self.root.after(REFINE_DELAY_MS, self._run_capacity_update)
+
+    def _run_capacity_update(self):
+        self._capacity_job = None
+        self.update_lsb_capacity()
+
     def reset_image(self):
         """重置圖片到原始狀態"""
         if hasattr(self, 'original_image') and self.original_image is not None:
-            self.preview_image = self.original_image.copy()
+            self._show_original()
             self.display_image()
             self.log_action("重置圖片", "成功", "已重置為原始圖片")
         else:
@@ -388,8 +539,8 @@ class WatermarkApp:
             self.log_action("載入浮水印圖片", "成功", path)
             messagebox.showinfo("已載入", f"浮水印圖片：{path}")
 
-    def display_image(self):
-        """顯示預覽圖像"""
+    def display_image(self, fast=True):
+        """顯示預覽圖像；先以快速濾鏡顯示，閒置後再以 LANCZOS 精修"""
         if self.preview_image is None:
             return
             
@@ -403,19 +554,22 @@ class WatermarkApp:
                 canvas_width = 600
                 canvas_height = 400
             
-            # 創建PIL圖像
-            img = Image.fromarray(self.preview_image)
+            # 更新縮圖金字塔（只重算浮水印外框內的區域），尺寸不同時重建
+            dirty = None if self._pyramid_stale else (self._pyramid_dirty or (0, 0, 0, 0))
+            if self.pyramid is None or not self.pyramid.update(self.preview_image, dirty):
+                self.pyramid = PreviewPyramid(self.preview_image)
+            self._pyramid_dirty, self._pyramid_stale = None, False
             
             # 計算縮放比例，保持原始比例
-            img_width, img_height = img.size
+            img_height, img_width = self.preview_image.shape[:2]
             scale = min(canvas_width / img_width, canvas_height / img_height)
             
             # 計算新尺寸
             new_width = int(img_width * scale)
             new_height = int(img_height * scale)
             
-            # 縮放圖像
-            img = img.resize((new_width, new_height), Image.LANCZOS)
+            # 從最接近的層級縮放圖像
+            img = self.pyramid.render((new_width, new_height), fast=fast)
             
             # 計算居中位置
             x_offset = (canvas_width - new_width) // 2
@@ -426,13 +580,28 @@ class WatermarkApp:
             self.canvas.imgtk = ImageTk.PhotoImage(img)
             self.canvas.create_image(x_offset, y_offset, anchor=NW, image=self.canvas.imgtk)
             
-            # 更新狀態欄
-            img_info = f"圖片尺寸: {img_width} × {img_height} 像素"
+            # 更新狀態欄：預覽可能是代理影像或縮圖，尺寸一律以原圖為準
+            if self.tiled_reader is not None:
+                full_width, full_height = self.tiled_reader.width, self.tiled_reader.height
+            else:
+                full_height, full_width = self.image.shape[:2]
+            img_info = f"圖片尺寸: {full_width} × {full_height} 像素"
             self.status_bar.config(text=img_info)
+            
+            # 閒置後再以高品質濾鏡重新顯示
+            if self._refine_job is not None:
+                self.root.after_cancel(self._refine_job)
+                self._refine_job = None
+            if fast:
+                self._refine_job = self.root.after(REFINE_DELAY_MS, self._refine_display)
         except Exception as e:
             self.log_action("顯示圖片", "失敗", str(e))
             self.status_bar.config(text=f"顯示圖片錯誤: {str(e)}")
 
+    def _refine_display(self):
+        self._refine_job = None
+        self.display_image(fast=False)
+
     def choose_color(self):
         color_result = colorchooser.askcolor(title="選擇文字顏色")
         if color_result[0]:  # color_result is ((r,g,b), '#rrggbb')
@@ -442,6 +611,7 @@ class WatermarkApp:
             self.color_value_label.config(text=rgb_str)
             self.color_preview.config(bg=color_result[1])
             self.log_action("選擇顏色", "成功", rgb_str)
+            self.schedule_live_render()
 
     def choose_font(self):
         path = filedialog.askopenfilename(filetypes=[("Font files", "*.ttf")])
@@ -449,9 +619,19 @@ class WatermarkApp:
             return
         self.font_path = path
         self._update_font_preview()
+        self.preload_font()
         self.log_action("選擇字型", "成功", path)
         messagebox.showinfo("已選擇字型", path)
 
+    def preload_font(self):
+        """在背景執行緒預先解析目前字型的字體大小，避免第一次套用時卡頓"""
+        try:
+            sizes = [int(self.font_size.get())]
+        except ValueError:
+            sizes = []
+        if self.font_path and Path(self.font_path).exists() and sizes:
+            threading.Thread(target=asset_cache.preload_font, args=(self.font_path, sizes), daemon=True).start()
+
     def _update_font_preview(self):
         """更新字型預覽"""
         try:
@@ -459,7 +639,7 @@ class WatermarkApp:
                 # 建立臨時圖像以顯示字型
                 img = Image.new('RGB', (200, 50), color=(255, 255, 255))
                 draw = ImageDraw.Draw(img)
-                font = ImageFont.truetype(self.font_path, 18)
+                font = asset_cache.get_font(self.font_path, 18)
                 draw.text((10, 10), "字型預覽 Aa 中文", font=font, fill=(0, 0, 0))
                 img_tk = ImageTk.PhotoImage(img)
                 self.font_preview.config(image=img_tk, text="")
@@ -476,60 +656,30 @@ class WatermarkApp:
             return messagebox.showwarning("警告", "請先載入主圖與浮水印圖")
         
         try:
-            alpha = int(self.alpha.get())
-            x, y = int(self.pos_x.get()), int(self.pos_y.get())
+            params = self.read_params()
         except:
             self.log_action("套用圖片浮水印", "失敗", "輸入參數格式錯誤")
             return messagebox.showwarning("格式錯誤", "請輸入數字")
 
-        base = Image.fromarray(self.image).convert("RGBA")
-
         try:
-            wm = Image.open(self.wm_image_path).convert("RGBA")
+            asset_cache.load_watermark(self.wm_image_path)
         except Exception as e:
             self.log_action("套用圖片浮水印", "失敗", f"無法載入浮水印圖: {str(e)}")
             return messagebox.showerror("錯誤", "無法載入浮水印圖")
 
-        base_w, base_h = base.size
-        wm_w, wm_h = wm.size
-
-        # 改進縮放算法：根據主圖尺寸智能調整浮水印大小
-        if x + wm_w > base_w or y + wm_h > base_h:
-            max_w = base_w - x
-            max_h = base_h - y
-            
-            # 如果浮水印太大，限制最大尺寸為主圖的 1/3
-            max_allowed_w = base_w / 3
-            max_allowed_h = base_h / 3
-            
-            max_w = min(max_w, max_allowed_w)
-            max_h = min(max_h, max_allowed_h)
-            
-            # 保持縱橫比縮放
-            scale = min(max_w / wm_w, max_h / wm_h, 1.0)
-            
-            # 確保高解析度圖片不會縮放太小
-            min_scale = 0.1  # 確保不會小於原始尺寸的 10
-            scale = max(scale, min_scale)
-            
-            wm = wm.resize((int(wm_w * scale), int(wm_h * scale)), Image.LANCZOS)
-            self.log_action("圖片浮水印縮放", "成功", f"縮放比例: {scale:.2f}")
-
-        if alpha < 255:
-            r, g, b, a = wm.split()
-            a = a.point(lambda i: int(i * (alpha / 255)))
-            wm.putalpha(a)
-
-        base.paste(wm, (x, y), wm)
-        self.preview_image = np.array(base.convert("RGB"))
+        log = lambda status, details: self.log_action("圖片浮水印縮放", status, details)
+        self.render_preview(self._watermark_render("image", params, log))
+        self.live_op, self.live_params = "image", params
         self.display_image()
-        self.log_action("套用圖片浮水印", "成功", f"位置: ({x}, {y}), 透明度: {alpha}")
+        self.log_action("套用圖片浮水印", "成功", f"位置: ({params.x}, {params.y}), 透明度: {params.alpha}")
 
     def save_image(self):
         """儲存處理後的圖像"""
         if self.preview_image is None:
             self.log_action("儲存圖片", "失敗", "未載入圖片")
             return messagebox.showwarning("警告", "沒有可儲存的圖片")
+        if self.tiled_reader is not None:
+            return self._save_large_image()
             
         try:
             # 取得原始檔名做為預設值
@@ -550,20 +700,102 @@ class WatermarkApp:
             )
             
             if path:
+                # 代理模式下此時才以原圖解析度輸出
+                output = self.preview_image
+                if self.pending_render is not None:
+                    output = self.pending_render(self.image, None)[0]
+                    
                 # 儲存圖片
-                cv2.imwrite(path, cv2.cvtColor(self.preview_image, cv2.COLOR_RGB2BGR))
+                cv2.imwrite(path, cv2.cvtColor(output, cv2.COLOR_RGB2BGR))
                 self.log_action("儲存圖片", "成功", path)
                 messagebox.showinfo("完成", f"圖片已儲存：{path}")
         except Exception as e:
             self.log_action("儲存圖片", "失敗", str(e))
             messagebox.showerror("錯誤", f"儲存圖片時發生錯誤：{str(e)}")
 
-    def text_to_bin(self, text):
-        return ''.join(format(b, '08b') for b in text.encode('utf-8'))
+    def _save_large_image(self):
+        """以列條帶在原圖上套用最近一次預覽的浮水印，輸出未壓縮 TIFF"""
+        path = filedialog.asksaveasfilename(defaultextension=".tif", filetypes=[("TIFF 圖片", "*.tif;*.tiff")],
+                                            initialfile=f"{Path(self.image_path).stem}_watermarked.tif")
+        if not path:
+            return
+
+        # 浮水印位置與大小以原圖座標計算，與縮圖上的預覽一致
+        layer = compositor.Layer([], True, None)
+        if self.live_op is not None:
+            log = lambda status, details: self.log_action("儲存圖片", status, details)
+            layer = core.WATERMARK_LAYERS[self.live_op](self.live_params, (self.tiled_reader.width, self.tiled_reader.height),
+                                                        self.wm_image_path or None, log)
+        src = self.image_path
+
+        def done(_, error):
+            if isinstance(error, ExtractionCancelled):
+                return self.log_action("儲存圖片", "取消", path)
+            if error is not None:
+                self.log_action("儲存圖片", "失敗", str(error))
+                return messagebox.showerror("錯誤", f"儲存圖片時發生錯誤：{str(error)}")
+            self.log_action("儲存圖片", "成功", path)
+            messagebox.showinfo("完成", f"圖片已儲存：{path}")
+
+        self.run_background("正在儲存大型圖片", lambda progress, cancel: tiled.watermark_file(src, path, layer, progress, cancel),
+                            done, message="正在以分塊方式套用浮水印...")
+
+    def _embed_large_image(self, action, payload, flags, codec, depth):
+        """以列條帶把資料嵌入大型主圖，輸出未壓縮 TIFF"""
+        path = filedialog.asksaveasfilename(defaultextension=".tif", filetypes=[("TIFF 圖片", "*.tif;*.tiff")])
+        if not path:
+            return
+        src, max_bytes = self.image_path, capacity_bytes(self.tiled_reader, depth)
+        estimate = expected_psnr(self.tiled_reader, len(payload), depth)
+
+        def done(used_bits, error):
+            if isinstance(error, ExtractionCancelled):
+                return self.log_action(action, "取消", path)
+            if error is not None:
+                self.log_action(action, "失敗", f"處理錯誤: {str(error)}")
+                return messagebox.showerror("錯誤", f"LSB處理錯誤: {str(error)}")
+            self.log_action(action, "成功", f"儲存至 {path}, 大小: {len(payload)}/{max_bytes} bytes, "
+                                          f"深度: {depth} bit, 預估 PSNR: {estimate:.1f} dB")
+            messagebox.showinfo("完成", f"✅ LSB 嵌入完成：{path}\n使用容量: {len(payload)}/{max_bytes} bytes\n"
+                                      f"預估 PSNR: {estimate:.1f} dB")
+
+        def work(progress, cancel):
+            return tiled.embed_container_file(src, path, payload, flags, codec, depth, progress, cancel)
 
-    def bin_to_text(self, binary):
-        bytes_arr = bytearray(int(binary[i:i+8], 2) for i in range(0, len(binary), 8))
-        return bytes_arr.decode('utf-8', errors='ignore')
+        self.run_background(action, work, done, message="正在以分塊方式嵌入...")
+
+    def _use_inplace(self, action):
+        """原地嵌入模式是否適用於目前主圖；格式不支援時改用一般流程"""
+        if not self.inplace_mode.get():
+            return False
+        if self.scatter_mode.get():
+            self.log_action(action, "資訊", "分散嵌入會改寫整張圖片，改為重新編碼輸出")
+            return False
+        if tiled.inplace_layout(self.image_path) is None:
+            self.log_action(action, "資訊", "主圖不是未壓縮 RGB 格式，改為重新編碼輸出")
+            return False
+        return True
+
+    def _scatter_key(self):
+        """分散嵌入模式下回傳密鑰位元組，未啟用時回傳 None；密鑰不正確或主圖為大型圖片時丟出 ValueError"""
+        if not self.scatter_mode.get():
+            return None
+        if self.tiled_reader is not None:
+            raise ValueError("分散嵌入需要整張載入圖片，不支援大型圖片")
+        return core.check_aes_key(self.aes_key_entry.get())
+
+    def _embed_inplace(self, action, payload, flags, codec, depth):
+        """以記憶體映射只改寫資料涵蓋的 LSB，輸出與原圖相同格式的副本（選擇原檔時直接改寫原檔）"""
+        source = Path(self.image_path)
+        path = filedialog.asksaveasfilename(defaultextension=source.suffix, filetypes=[("與原圖相同格式", f"*{source.suffix}")],
+                                            initialfile=f"{source.stem}_lsb{source.suffix}")
+        if not path:
+            return
+        start = time.perf_counter()
+        tiled.embed_container_inplace(self.image_path, payload, flags, codec, depth, output=path)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.log_action(action, "成功", f"原地嵌入 {path}, 大小: {len(payload)} bytes, 深度: {depth} bit, 耗時 {elapsed:.1f} ms")
+        messagebox.showinfo("完成", f"✅ LSB 原地嵌入完成：{path}\n使用容量: {len(payload)} bytes")
 
     def embed_lsb_text(self):
         if not self.image_path: 
@@ -579,41 +811,32 @@ class WatermarkApp:
         if not hidden_text:
             self.log_action("嵌入文字LSB", "失敗", "未輸入隱藏文字")
             return messagebox.showerror("錯誤", "請輸入要隱藏的文字")
-            
-        try:
-            cipher = AES.new(key.encode('utf-8'), AES.MODE_ECB)
-            padded = pad(hidden_text.encode('utf-8'), AES.block_size)
-            msg = base64.b64encode(cipher.encrypt(padded)).decode('utf-8')
-        except Exception as e:
-            self.log_action("嵌入文字LSB", "失敗", f"加密錯誤: {str(e)}")
-            return messagebox.showerror("錯誤", f"加密過程出錯: {str(e)}")
 
+        compress, depth = self.compress_mode.get(), self.lsb_depth.get()
         try:
-            img = cv2.imread(self.image_path)
-            max_bits = img.size  # total pixels * channels
-            max_bytes = (max_bits - len(SENTINEL)) // 8
-            encrypted_size = len(base64.b64decode(msg.encode('utf-8')))
-            
-            if encrypted_size > max_bytes:
-                self.log_action("嵌入文字LSB", "失敗", f"訊息過長 ({encrypted_size}/{max_bytes} bytes)")
-                return messagebox.showerror("錯誤", f"訊息過長，最大可嵌入約 {max_bytes} bytes，目前需要 {encrypted_size} bytes")
-
-            bin_msg = self.text_to_bin(msg) + SENTINEL
-            h, w, _ = img.shape; idx = 0
-
-            for r in range(h):
-                for c in range(w):
-                    for ch in range(3):
-                        if idx < len(bin_msg):
-                            img[r,c,ch] = (img[r,c,ch] & 254) | int(bin_msg[idx])
-                            idx += 1
+            scatter = self._scatter_key() is not None
+            if self._use_inplace("嵌入文字LSB"):
+                carrier = self.tiled_reader or tiled.StripReader(self.image_path)
+                payload = core.lsb_text_payload(hidden_text, key, carrier, compress, depth)
+                return self._embed_inplace("嵌入文字LSB", *payload, depth)
+            if self.tiled_reader is not None:
+                payload = core.lsb_text_payload(hidden_text, key, self.tiled_reader, compress, depth)
+                return self._embed_large_image("嵌入文字LSB", *payload, depth)
+            original = cv2.imread(self.image_path)
+            img, encrypted_size, max_bytes = core.embed_lsb_text(original, hidden_text, key, compress, depth, scatter)
 
             path = filedialog.asksaveasfilename(defaultextension=".png")
             if path:
                 cv2.imwrite(path, img)
-                self.log_action("嵌入文字LSB", "成功", f"儲存至 {path}, 大小: {encrypted_size}/{max_bytes} bytes")
-                messagebox.showinfo("完成", f"✅ LSB 文字嵌入完成：{path}\n使用容量: {encrypted_size}/{max_bytes} bytes")
-                self.preview_image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+                quality = psnr(original, img)
+                self.log_action("嵌入文字LSB", "成功", f"儲存至 {path}, 大小: {encrypted_size}/{max_bytes} bytes, "
+                                                    f"深度: {depth} bit, PSNR: {quality:.1f} dB")
+                messagebox.showinfo("完成", f"✅ LSB 文字嵌入完成：{path}\n使用容量: {encrypted_size}/{max_bytes} bytes\n"
+                                          f"PSNR: {quality:.1f} dB")
+                self.live_renderer.cancel()
+                self._set_preview(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+                self.pending_render = None
+                self.live_op = None
                 self.display_image()
         except Exception as e:
             self.log_action("嵌入文字LSB", "失敗", f"處理錯誤: {str(e)}")
@@ -625,65 +848,137 @@ class WatermarkApp:
             return messagebox.showwarning("警告", "請先載入主圖與浮水印圖")
         
         try:
-            img = cv2.imread(self.image_path)
+            scatter_key = self._scatter_key()
+            # 大型圖片只需要尺寸判斷容量，嵌入時再以條帶處理
+            img = self.tiled_reader if self.tiled_reader is not None else cv2.imread(self.image_path)
             wm_img = cv2.imread(self.wm_image_path)
-            
-            # 檢查浮水印圖片大小
-            h, w, _ = img.shape
-            wm_h, wm_w, _ = wm_img.shape
-            
-            # 如果浮水印圖片太大，提供縮放選項
-            if wm_img.size * 8 > img.size - len(SENTINEL):
-                result = messagebox.askyesno("浮水印過大", 
-                    "浮水印圖片太大，無法完整嵌入。要自動縮放浮水印圖片嗎？\n" + 
-                    f"主圖容量: {(img.size - len(SENTINEL))//8} bytes\n" +
-                    f"浮水印需要: {wm_img.size} bytes")
-                
-                if result:
-                    # 計算需要的縮放比例
-                    target_size = (img.size - len(SENTINEL)) // 10  # 預留空間，只使用90%容量
-                    scale_factor = (target_size / wm_img.size) ** 0.5  # 平方根，因為縮放同時影響寬高
-                    
-                    new_width = int(wm_w * scale_factor)
-                    new_height = int(wm_h * scale_factor)
-                    
-                    if new_width < 10 or new_height < 10:
-                        self.log_action("嵌入圖片LSB", "失敗", "縮放後圖片太小")
-                        return messagebox.showerror("錯誤", "縮放後浮水印太小，無法使用")
-                    
-                    wm_img = cv2.resize(wm_img, (new_width, new_height), interpolation=cv2.INTER_AREA)
-                    self.log_action("嵌入圖片LSB", "警告", f"浮水印已縮放至 {new_width}x{new_height}")
-                else:
-                    self.log_action("嵌入圖片LSB", "取消", "使用者取消縮放")
-                    return
-            
-            # 編碼圖片
-            _, buffer = cv2.imencode('.png', wm_img)
-            encoded_str = base64.b64encode(buffer).decode('utf-8')
-            bin_data = self.text_to_bin(encoded_str) + SENTINEL
-            
-            # 再次檢查容量
-            if len(bin_data) > img.size:
-                self.log_action("嵌入圖片LSB", "失敗", "編碼後數據仍然過大")
-                return messagebox.showerror("錯誤", "即使縮放後，浮水印仍然太大")
-            
-            h, w, _ = img.shape; idx = 0
-            for r in range(h):
-                for c in range(w):
-                    for ch in range(3):
-                        if idx < len(bin_data):
-                            img[r, c, ch] = (img[r, c, ch] & 254) | int(bin_data[idx])
-                            idx += 1
+            if wm_img is None:
+                raise ValueError("無法載入浮水印圖片")
+        except Exception as e:
+            self.log_action("嵌入圖片LSB", "失敗", f"處理錯誤: {str(e)}")
+            return messagebox.showerror("錯誤", f"處理錯誤: {str(e)}")
+
+        # PNG 編碼與壓縮可能需要數秒，在背景執行
+        compress = self.compress_mode.get()
+
+        def encode(progress, cancel):
+            payload = core.encode_lsb_image(wm_img, compress)
+            check_cancel(cancel)
+            return payload
+
+        self.run_background("嵌入圖片LSB", encode,
+                            lambda payload, error: self._fit_lsb_image(img, wm_img, compress, scatter_key, payload, error),
+                            message="正在編碼浮水印...")
+
+    def _fit_lsb_image(self, img, wm_img, compress, scatter_key, payload, error):
+        """容量不足時詢問提高嵌入深度或縮放浮水印，再交給 _write_lsb_image"""
+        if isinstance(error, ExtractionCancelled):
+            return self.log_action("嵌入圖片LSB", "取消", "使用者取消編碼")
+        if error is not None:
+            self.log_action("嵌入圖片LSB", "失敗", f"處理錯誤: {str(error)}")
+            return messagebox.showerror("錯誤", f"處理錯誤: {str(error)}")
+
+        depth = self.lsb_depth.get()
+        needed = len(payload[0])
+
+        # 目前深度放不下時，優先提高嵌入深度以完整保留浮水印
+        if needed > capacity_bytes(img, depth):
+            deeper = required_depth(img, needed)
+            if deeper is not None and messagebox.askyesno("浮水印過大",
+                    f"浮水印需要 {needed} bytes，目前深度的容量為 {capacity_bytes(img, depth)} bytes。\n" +
+                    f"改用每通道 {deeper} bits 嵌入即可完整保留浮水印（預估 PSNR {expected_psnr(img, needed, deeper):.1f} dB），" +
+                    "要提高嵌入深度嗎？\n選「否」則改為縮放浮水印。"):
+                depth = deeper
+                self.lsb_depth.set(depth)
+                self.update_lsb_capacity()
+                self.log_action("嵌入圖片LSB", "資訊", f"嵌入深度提高為 {depth} bit/通道")
+
+        if needed <= capacity_bytes(img, depth):
+            return self._write_lsb_image(img, payload, None, scatter_key)
+
+        # 仍然放不下時，提供縮放選項
+        result = messagebox.askyesno("浮水印過大", 
+            "浮水印圖片太大，無法完整嵌入。要自動縮放浮水印圖片嗎？\n" + 
+            f"主圖容量: {capacity_bytes(img, depth)} bytes\n" +
+            f"浮水印需要: {needed} bytes")
+        if not result:
+            self.log_action("嵌入圖片LSB", "取消", "使用者取消縮放")
+            return
+
+        wm_img = core.shrink_lsb_watermark(img, wm_img, depth)
+        if wm_img is None:
+            self.log_action("嵌入圖片LSB", "失敗", "縮放後圖片太小")
+            return messagebox.showerror("錯誤", "縮放後浮水印太小，無法使用")
+
+        new_height, new_width = wm_img.shape[:2]
+        self.log_action("嵌入圖片LSB", "警告", f"浮水印已縮放至 {new_width}x{new_height}")
+
+        def encode(progress, cancel):
+            payload = core.lsb_image_payload(wm_img, img, compress, depth)
+            check_cancel(cancel)
+            return payload
+
+        self.run_background("嵌入圖片LSB", encode,
+                            lambda payload, error: self._write_lsb_image(img, payload, error, scatter_key),
+                            message="正在編碼浮水印...")
+
+    def _write_lsb_image(self, img, payload, error, scatter_key):
+        """把編碼好的浮水印嵌入主圖並儲存"""
+        if isinstance(error, ExtractionCancelled):
+            return self.log_action("嵌入圖片LSB", "取消", "使用者取消編碼")
+        depth = self.lsb_depth.get()
+        try:
+            if error is not None:
+                raise error
+            if self._use_inplace("嵌入圖片LSB"):
+                return self._embed_inplace("嵌入圖片LSB", *payload, depth)
+            if self.tiled_reader is not None:
+                return self._embed_large_image("嵌入圖片LSB", *payload, depth)
+            out = embed_container(img, *payload, depth, scatter_key)
+            used, max_bytes = len(payload[0]), capacity_bytes(img, depth)
             
             path = filedialog.asksaveasfilename(defaultextension=".png")
             if path:
-                cv2.imwrite(path, img)
-                self.log_action("嵌入圖片LSB", "成功", f"使用容量: {len(bin_data)/8}/{img.size/8} bytes")
-                messagebox.showinfo("完成", f"✅ 圖片已嵌入圖片 LSB 中\n使用容量: {len(bin_data)/8:.0f}/{img.size/8:.0f} bytes")
+                cv2.imwrite(path, out)
+                quality = psnr(img, out)
+                self.log_action("嵌入圖片LSB", "成功", f"使用容量: {used}/{max_bytes} bytes, 深度: {depth} bit, "
+                                                    f"PSNR: {quality:.1f} dB")
+                messagebox.showinfo("完成", f"✅ 圖片已嵌入圖片 LSB 中\n使用容量: {used}/{max_bytes} bytes\n"
+                                          f"PSNR: {quality:.1f} dB")
         except Exception as e:
             self.log_action("嵌入圖片LSB", "失敗", f"處理錯誤: {str(e)}")
             messagebox.showerror("錯誤", f"處理錯誤: {str(e)}")
 
+    def run_background(self, title, work, on_done, message="正在分析圖片中的LSB數據..."):
+        """在背景執行緒執行 work(progress, cancel)，進度經由佇列回報並以 after() 輪詢；
+        完成後在主執行緒呼叫 on_done(結果, 例外)"""
+        progress = ProgressWindow(self.root, title, message, geometry="400x130")
+        messages = queue.Queue()
+
+        def run():
+            try:
+                result = work(lambda fraction: messages.put(("progress", fraction)), progress.cancel)
+                messages.put(("done", result, None))
+            except Exception as e:
+                messages.put(("done", None, e))
+
+        def poll():
+            # 一次取完佇列中的訊息，只顯示最新進度
+            while True:
+                try:
+                    message = messages.get_nowait()
+                except queue.Empty:
+                    break
+                if message[0] == "progress":
+                    progress.show(fraction=message[1])
+                else:
+                    progress.close()
+                    return on_done(message[1], message[2])
+            self.root.after(EXTRACT_POLL_MS, poll)
+
+        threading.Thread(target=run, daemon=True).start()
+        self.root.after(EXTRACT_POLL_MS, poll)
+
     def extract_lsb(self):
         path = filedialog.askopenfilename(title="選擇含LSB的圖片")
         if not path: return
@@ -694,207 +989,154 @@ class WatermarkApp:
             return messagebox.showerror("錯誤", "請輸入長度為16的加密密鑰")
             
         try:
+            # AES-GCM 文字資料邊讀邊解密，密鑰錯誤時讀完前置資料即停止
+            extract = self._lsb_extractor(path, core.lsb_text_decoder(key), core.check_aes_key(key))
+        except Exception as e:
+            self.log_action("讀取LSB", "失敗", f"處理錯誤: {str(e)}")
+            return messagebox.showerror("錯誤", f"處理錯誤: {str(e)}")
+
+        # 讀取標頭後直接切出資料，舊版圖片則分塊尋找終止標記
+        self.run_background("正在提取LSB", extract, lambda found, error: self._show_lsb_text(path, key, found, error))
+
+    def _lsb_extractor(self, path, decoder=None, scatter_key=None):
+        """回傳讀取 LSB 的 work(progress, cancel)；大型圖片以列條帶讀取，一般圖片也在背景解碼，
+        無法載入時由 work 丟出 ValueError"""
+        if tiled.is_large(path):
+            return lambda progress, cancel: tiled.extract_payload_file(path, progress, cancel, decoder, scatter_key)
+
+        def work(progress, cancel):
             img = cv2.imread(path)
             if img is None:
-                self.log_action("讀取LSB", "失敗", f"無法載入圖片 {path}")
-                return messagebox.showerror("錯誤", "無法載入圖片")
+                raise ValueError(f"無法載入圖片 {path}")
+            return extract_payload(img, progress=progress, cancel=cancel, decoder=decoder, scatter_key=scatter_key)
+        return work
+
+    def _show_lsb_text(self, path, key, found, error):
+        """顯示背景讀取的文字 LSB 結果"""
+        if isinstance(error, ExtractionCancelled):
+            return self.log_action("讀取LSB", "取消", "使用者取消讀取")
+        if error is not None:
+            self.log_action("讀取LSB", "失敗", f"處理錯誤: {str(error)}")
+            return messagebox.showerror("錯誤", f"處理錯誤: {str(error)}")
+
+        if found is not None:
+            header, payload = found
+            if header is not None and header.flags & FLAG_IMAGE:
+                self.log_action("讀取LSB", "失敗", "LSB 內容為圖片")
+                return messagebox.showerror("錯誤", "此圖片嵌入的是圖片資料，請使用「讀出圖片LSB」")
+            # 解密
+            try:
+                decrypted = core.decode_lsb_text(header, payload, key)
                 
-            # 顯示進度對話框
-            progress = Toplevel(self.root)
-            progress.title("正在提取LSB")
-            progress.geometry("300x100")
-            progress_label = Label(progress, text="正在分析圖片中的LSB數據...", pady=10)
-            progress_label.pack()
-            progress_bar = ttk.Progressbar(progress, orient="horizontal", length=250, mode="determinate")
-            progress_bar.pack(pady=10)
-            progress.update()
-            
-            # 提取數據
-            h, w, c = img.shape
-            total_pixels = h * w
-            bin_msg = []
-            found_sentinel = False
-            
-            for r in range(h):
-                if found_sentinel: break
-                for c in range(w):
-                    if found_sentinel: break
-                    
-                    # 更新進度條
-                    if (r * w + c) % 10000 == 0:  # 每10000像素更新一次
-                        progress_percent = (r * w + c) / total_pixels * 100
-                        progress_bar["value"] = progress_percent
-                        progress.update()
-                    
-                    for ch in range(3):
-                        bin_msg.append(str(img[r, c, ch] & 1))
-                        
-                        # 檢查是否已有足夠的位元來檢查SENTINEL
-                        if len(bin_msg) >= len(SENTINEL):
-                            # 檢查最後的位元是否匹配SENTINEL
-                            last_bits = ''.join(bin_msg[-len(SENTINEL):])
-                            if last_bits == SENTINEL:
-                                found_sentinel = True
-                                break
-            
-            progress.destroy()
-            
-            if found_sentinel:
-                # 提取出SENTINEL之前的數據
-                extracted_bits = ''.join(bin_msg[:-len(SENTINEL)])
-                # 轉換為文字
-                try:
-                    msg = self.bin_to_text(extracted_bits)
-                    # 解密
-                    cipher = AES.new(key.encode('utf-8'), AES.MODE_ECB)
-                    decrypted = unpad(cipher.decrypt(base64.b64decode(msg)), AES.block_size).decode('utf-8')
-                    
-                    # 顯示結果
-                    result_window = Toplevel(self.root)
-                    result_window.title("LSB提取結果")
-                    result_window.geometry("400x300")
-                    
-                    Label(result_window, text="成功提取隱藏訊息", font=("Arial", 12, "bold")).pack(pady=10)
-                    
-                    text_frame = Frame(result_window)
-                    text_frame.pack(fill=BOTH, expand=True, padx=10, pady=10)
-                    
-                    text_widget = Text(text_frame, wrap=WORD, height=10)
-                    text_widget.pack(side=LEFT, fill=BOTH, expand=True)
-                    
-                    scrollbar = Scrollbar(text_frame, command=text_widget.yview)
-                    scrollbar.pack(side=RIGHT, fill=Y)
-                    text_widget.config(yscrollcommand=scrollbar.set)
-                    
-                    text_widget.insert(END, decrypted)
-                    text_widget.config(state=DISABLED)
-                    
-                    Button(result_window, text="複製到剪貼簿", command=lambda: self.copy_to_clipboard(decrypted)).pack(pady=5)
-                    Button(result_window, text="關閉", command=result_window.destroy).pack(pady=5)
-                    
-                    self.log_action("讀取LSB", "成功", f"從 {path} 提取")
-                except Exception as e:
-                    self.log_action("讀取LSB", "失敗", f"解密錯誤: {str(e)}")
-                    messagebox.showerror("錯誤", f"解密失敗，請確認密鑰正確: {str(e)}")
-            else:
-                self.log_action("讀取LSB", "失敗", "未找到LSB終止標記")
-                messagebox.showerror("錯誤", "在圖片中未找到有效的LSB隱寫數據")
-        except Exception as e:
-            self.log_action("讀取LSB", "失敗", f"處理錯誤: {str(e)}")
-            messagebox.showerror("錯誤", f"處理錯誤: {str(e)}")
+                # 顯示結果
+                result_window = Toplevel(self.root)
+                result_window.title("LSB提取結果")
+                result_window.geometry("400x300")
+                
+                Label(result_window, text="成功提取隱藏訊息", font=("Arial", 12, "bold")).pack(pady=10)
+                
+                text_frame = Frame(result_window)
+                text_frame.pack(fill=BOTH, expand=True, padx=10, pady=10)
+                
+                text_widget = Text(text_frame, wrap=WORD, height=10)
+                text_widget.pack(side=LEFT, fill=BOTH, expand=True)
+                
+                scrollbar = Scrollbar(text_frame, command=text_widget.yview)
+                scrollbar.pack(side=RIGHT, fill=Y)
+                text_widget.config(yscrollcommand=scrollbar.set)
+                
+                text_widget.insert(END, decrypted)
+                text_widget.config(state=DISABLED)
+                
+                Button(result_window, text="複製到剪貼簿", command=lambda: self.copy_to_clipboard(decrypted)).pack(pady=5)
+                Button(result_window, text="關閉", command=result_window.destroy).pack(pady=5)
+                
+                self.log_action("讀取LSB", "成功", f"從 {path} 提取")
+            except Exception as e:
+                self.log_action("讀取LSB", "失敗", f"解密錯誤: {str(e)}")
+                messagebox.showerror("錯誤", f"解密失敗，請確認密鑰正確: {str(e)}")
+        else:
+            self.log_action("讀取LSB", "失敗", "未找到LSB標頭或終止標記")
+            messagebox.showerror("錯誤", "在圖片中未找到有效的LSB隱寫數據")
 
     def extract_lsb_image(self):
         path = filedialog.askopenfilename(title="選擇含圖片LSB的圖片")
         if not path: return
         
+        # 分散嵌入的圖片需要密鑰才能找到資料位置
+        key = self.aes_key_entry.get()
+        scatter_key = core.check_aes_key(key) if len(key) == 16 else None
         try:
-            img = cv2.imread(path)
-            if img is None:
-                self.log_action("讀出圖片LSB", "失敗", f"無法載入圖片 {path}")
-                return messagebox.showerror("錯誤", "無法載入圖片")
-                
-            # 顯示進度對話框
-            progress = Toplevel(self.root)
-            progress.title("正在提取圖片LSB")
-            progress.geometry("300x100")
-            progress_label = Label(progress, text="正在分析圖片中的LSB數據...", pady=10)
-            progress_label.pack()
-            progress_bar = ttk.Progressbar(progress, orient="horizontal", length=250, mode="determinate")
-            progress_bar.pack(pady=10)
-            progress.update()
-            
-            # 提取數據
-            h, w, c = img.shape
-            total_pixels = h * w
-            bin_msg = []
-            found_sentinel = False
-            
-            for r in range(h):
-                if found_sentinel: break
-                for c in range(w):
-                    if found_sentinel: break
-                    
-                    # 更新進度條
-                    if (r * w + c) % 10000 == 0:  # 每10000像素更新一次
-                        progress_percent = (r * w + c) / total_pixels * 100
-                        progress_bar["value"] = progress_percent
-                        progress.update()
-                    
-                    for ch in range(3):
-                        bin_msg.append(str(img[r, c, ch] & 1))
-                        
-                        # 檢查是否已有足夠的位元來檢查SENTINEL
-                        if len(bin_msg) >= len(SENTINEL):
-                            # 檢查最後的位元是否匹配SENTINEL
-                            last_bits = ''.join(bin_msg[-len(SENTINEL):])
-                            if last_bits == SENTINEL:
-                                found_sentinel = True
-                                break
-            
-            progress.destroy()
-            
-            if found_sentinel:
-                # 提取出SENTINEL之前的數據
-                extracted_bits = ''.join(bin_msg[:-len(SENTINEL)])
-                # 轉換為文字
-                try:
-                    content = self.bin_to_text(extracted_bits)
-                    decoded = base64.b64decode(content.encode('utf-8'))
-                    
-                    # 顯示預覽視窗
-                    preview_window = Toplevel(self.root)
-                    preview_window.title("提取的圖片預覽")
-                    preview_window.geometry("600x500")
-                    
-                    # 解碼並顯示圖片
-                    np_arr = np.frombuffer(decoded, np.uint8)
-                    extracted_img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-                    extracted_img_rgb = cv2.cvtColor(extracted_img, cv2.COLOR_BGR2RGB)
-                    
-                    h, w, _ = extracted_img.shape
-                    info_text = f"提取的圖片尺寸: {w} x {h}"
-                    
-                    Label(preview_window, text="成功提取隱藏圖片", font=("Arial", 12, "bold")).pack(pady=5)
-                    Label(preview_window, text=info_text).pack(pady=5)
-                    
-                    # 預覽圖片
-                    preview_img = Image.fromarray(extracted_img_rgb)
-                    
-                    # 調整大小以適應視窗
-                    preview_w, preview_h = preview_img.size
-                    max_size = 400
-                    if preview_w > max_size or preview_h > max_size:
-                        scale = min(max_size / preview_w, max_size / preview_h)
-                        preview_img = preview_img.resize((int(preview_w * scale), int(preview_h * scale)), Image.LANCZOS)
-                    
-                    photo = ImageTk.PhotoImage(preview_img)
-                    img_label = Label(preview_window, image=photo)
-                    img_label.image = photo  # 保持引用
-                    img_label.pack(pady=10)
-                    
-                    # 儲存按鈕
-                    def save_extracted_image():
-                        save_path = filedialog.asksaveasfilename(defaultextension=".png")
-                        if save_path:
-                            with open(save_path, "wb") as f:
-                                f.write(decoded)
-                            self.log_action("讀出圖片LSB", "儲存", f"儲存至 {save_path}")
-                            messagebox.showinfo("成功", f"已提取圖片，儲存為 {save_path}")
-                            preview_window.destroy()
-                    
-                    Button(preview_window, text="儲存圖片", command=save_extracted_image).pack(pady=5)
-                    Button(preview_window, text="關閉", command=preview_window.destroy).pack(pady=5)
-                    
-                    self.log_action("讀出圖片LSB", "成功", f"從 {path} 提取")
-                except Exception as e:
-                    self.log_action("讀出圖片LSB", "失敗", f"解碼錯誤: {str(e)}")
-                    messagebox.showerror("失敗", f"無法解碼圖片資料: {str(e)}")
-            else:
-                self.log_action("讀出圖片LSB", "失敗", "未找到LSB終止標記")
-                messagebox.showerror("錯誤", "在圖片中未找到有效的LSB圖片數據")
+            extract = self._lsb_extractor(path, scatter_key=scatter_key)
         except Exception as e:
             self.log_action("讀出圖片LSB", "失敗", f"處理錯誤: {str(e)}")
-            messagebox.showerror("錯誤", f"處理錯誤: {str(e)}")
+            return messagebox.showerror("錯誤", f"處理錯誤: {str(e)}")
+
+        # 讀取標頭後直接切出資料，舊版圖片則分塊尋找終止標記
+        self.run_background("正在提取圖片LSB", extract, lambda found, error: self._show_lsb_image(path, found, error))
+
+    def _show_lsb_image(self, path, found, error):
+        """顯示背景讀取的圖片 LSB 結果"""
+        if isinstance(error, ExtractionCancelled):
+            return self.log_action("讀出圖片LSB", "取消", "使用者取消讀取")
+        if error is not None:
+            self.log_action("讀出圖片LSB", "失敗", f"處理錯誤: {str(error)}")
+            return messagebox.showerror("錯誤", f"處理錯誤: {str(error)}")
+
+        if found is not None:
+            header, payload = found
+            # 解碼圖片
+            try:
+                decoded, extracted_img = core.decode_lsb_image(header, payload)
+                
+                # 顯示預覽視窗
+                preview_window = Toplevel(self.root)
+                preview_window.title("提取的圖片預覽")
+                preview_window.geometry("600x500")
+                
+                extracted_img_rgb = cv2.cvtColor(extracted_img, cv2.COLOR_BGR2RGB)
+                
+                h, w, _ = extracted_img.shape
+                info_text = f"提取的圖片尺寸: {w} x {h}"
+                
+                Label(preview_window, text="成功提取隱藏圖片", font=("Arial", 12, "bold")).pack(pady=5)
+                Label(preview_window, text=info_text).pack(pady=5)
+                
+                # 預覽圖片
+                preview_img = Image.fromarray(extracted_img_rgb)
+                
+                # 調整大小以適應視窗
+                preview_w, preview_h = preview_img.size
+                max_size = 400
+                if preview_w > max_size or preview_h > max_size:
+                    scale = min(max_size / preview_w, max_size / preview_h)
+                    preview_img = preview_img.resize((int(preview_w * scale), int(preview_h * scale)), Image.LANCZOS)
+                
+                photo = ImageTk.PhotoImage(preview_img)
+                img_label = Label(preview_window, image=photo)
+                img_label.image = photo  # 保持引用
+                img_label.pack(pady=10)
+                
+                # 儲存按鈕
+                def save_extracted_image():
+                    save_path = filedialog.asksaveasfilename(defaultextension=".png")
+                    if save_path:
+                        with open(save_path, "wb") as f:
+                            f.write(decoded)
+                        self.log_action("讀出圖片LSB", "儲存", f"儲存至 {save_path}")
+                        messagebox.showinfo("成功", f"已提取圖片，儲存為 {save_path}")
+                        preview_window.destroy()
+                
+                Button(preview_window, text="儲存圖片", command=save_extracted_image).pack(pady=5)
+                Button(preview_window, text="關閉", command=preview_window.destroy).pack(pady=5)
+                
+                self.log_action("讀出圖片LSB", "成功", f"從 {path} 提取")
+            except Exception as e:
+                self.log_action("讀出圖片LSB", "失敗", f"解碼錯誤: {str(e)}")
+                messagebox.showerror("失敗", f"無法解碼圖片資料: {str(e)}")
+        else:
+            self.log_action("讀出圖片LSB", "失敗", "未找到LSB標頭或終止標記")
+            messagebox.showerror("錯誤", "在圖片中未找到有效的LSB圖片數據")
 
     def copy_to_clipboard(self, text):
         """複製文字到剪貼簿"""
@@ -919,11 +1161,7 @@ class WatermarkApp:
             return
             
         # 獲取所有支援的圖片文件
-        supported_formats = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
-        image_files = []
-        for ext in supported_formats:
-            image_files.extend(list(Path(input_dir).glob(f'*{ext}')))
-            image_files.extend(list(Path(input_dir).glob(f'*{ext.upper()}')))
+        image_files = batch_engine.find_images(input_dir)
             
         if not image_files:
             self.log_action("批次浮水印", "失敗", "未找到支援的圖片文件")
@@ -931,127 +1169,217 @@ class WatermarkApp:
             
         try:
             # 取得參數
-            fs, a, x, y = map(lambda e: int(e.get()), [self.font_size, self.alpha, self.pos_x, self.pos_y])
+            params = self.read_params()
         except Exception as e:
             self.log_action("批次浮水印", "失敗", f"參數解析錯誤: {str(e)}")
             return messagebox.showwarning("格式錯誤", "請輸入數字")
+
+        if params.text.strip():
+            params.add_qrcode = messagebox.askyesno("QR碼", "是否同時在每張圖片左下角加入文字的 QR code？")
             
-        text = self.text_entry.get().strip()
-        
-        # 是否需要加載字體
-        try:
-            font = ImageFont.truetype(self.font_path, fs) if self.font_path and Path(self.font_path).exists() else ImageFont.load_default()
-        except Exception as e:
-            self.log_action("批次浮水印", "警告", f"字型載入失敗: {str(e)}")
-            font = ImageFont.load_default()
-            
-        # 加載浮水印圖片（如果有）
-        wm_image = None
-        if self.wm_image_path:
-            try:
-                wm_image = Image.open(self.wm_image_path).convert("RGBA")
-            except Exception as e:
-                self.log_action("批次浮水印", "警告", f"浮水印圖片載入失敗: {str(e)}")
-                
         # 創建進度窗口
-        progress_window = Toplevel(self.root)
-        progress_window.title("批次處理進度")
-        progress_window.geometry("400x150")
+        progress = ProgressWindow(self.root, "批次處理進度", "正在處理圖片...", f"0/{len(image_files)} 已完成")
+        progress.update()
         
-        progress_label = Label(progress_window, text="正在處理圖片...")
-        progress_label.pack(pady=10)
-        
-        progress_bar = ttk.Progressbar(progress_window, orient="horizontal", length=350, mode="determinate")
-        progress_bar.pack(pady=10)
-        
-        status_label = Label(progress_window, text="0/{} 已完成".format(len(image_files)))
-        status_label.pack(pady=5)
-        
-        progress_window.update()
-        
-        # 批次處理所有圖片
+        # 以多程序平行處理，字型與浮水印圖在每個工作程序只載入一次
         processed_count = 0
         success_count = 0
         
-        for img_path in image_files:
-            try:
-                # 更新進度
-                progress_label.config(text=f"正在處理: {img_path.name}")
-                progress_window.update()
-                
-                # 開啟圖片
-                img = Image.open(img_path).convert("RGBA")
-                
-                # 創建疊加層
-                overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
-                draw = ImageDraw.Draw(overlay)
-                
-                # 套用文字浮水印
-                if text:
-                    draw.text((x, y), text, font=font, fill=self.color + (a,))
-                
-                # 套用圖片浮水印
-                if wm_image:
-                    # 調整浮水印圖片大小
-                    wm_width, wm_height = wm_image.size
-                    img_width, img_height = img.size
-                    
-                    # 確保浮水印不會超過原圖大小的1/4
-                    max_wm_width = img_width // 4
-                    max_wm_height = img_height // 4
-                    
-                    if wm_width > max_wm_width or wm_height > max_wm_height:
-                        scale = min(max_wm_width / wm_width, max_wm_height / wm_height)
-                        new_size = (int(wm_width * scale), int(wm_height * scale))
-                        resized_wm = wm_image.resize(new_size, Image.LANCZOS)
-                    else:
-                        resized_wm = wm_image
-                    
-                    # 計算貼上位置（右下角）
-                    paste_x = img_width - resized_wm.width - x
-                    paste_y = img_height - resized_wm.height - y
-                    
-                    # 確保不會超出圖片範圍
-                    paste_x = max(0, min(paste_x, img_width - resized_wm.width))
-                    paste_y = max(0, min(paste_y, img_height - resized_wm.height))
-                    
-                    # 使用 alpha 混合浮水印圖片
-                    alpha_resized = Image.new("RGBA", resized_wm.size, (0, 0, 0, 0))
-                    alpha_draw = ImageDraw.Draw(alpha_resized)
-                    
-                    for i in range(resized_wm.width):
-                        for j in range(resized_wm.height):
-                            p = resized_wm.getpixel((i, j))
-                            if p[3] > 0:  # 有透明度
-                                alpha_resized.putpixel((i, j), (p[0], p[1], p[2], min(p[3], a)))
-                    
-                    overlay.paste(alpha_resized, (paste_x, paste_y), alpha_resized)
-                
-                # 合併原圖和浮水印層
-                result = Image.alpha_composite(img, overlay).convert("RGB")
-                
-                # 儲存結果
-                output_path = Path(output_dir) / img_path.name
-                result.save(output_path)
-                
+        results = batch_engine.run_batch(image_files, output_dir, params, self.wm_image_path,
+                                         workers=self.batch_workers, on_idle=progress.update)
+        for name, ok, error in results:
+            if ok:
                 success_count += 1
-                self.log_action("批次浮水印", "成功", f"已處理 {img_path.name}")
-                
-            except Exception as e:
-                self.log_action("批次浮水印", "失敗", f"處理 {img_path.name} 時出錯: {str(e)}")
+                self.log_action("批次浮水印", "成功", f"已處理 {name}")
+            else:
+                self.log_action("批次浮水印", "失敗", f"處理 {name} 時出錯: {error}")
             
             # 更新進度條
             processed_count += 1
-            progress_bar["value"] = (processed_count / len(image_files)) * 100
-            status_label.config(text=f"{processed_count}/{len(image_files)} 已完成")
-            progress_window.update()
+            progress.show(f"已處理: {name}", f"{processed_count}/{len(image_files)} 已完成",
+                          processed_count / len(image_files))
+            progress.update()
+            if progress.cancel.is_set():
+                # 關閉產生器會結束程序池，尚未開始的圖片不再處理
+                results.close()
+                break
         
         # 處理完成
-        progress_window.destroy()
+        progress.close()
         
         # 顯示結果
-        self.log_action("批次浮水印", "完成", f"已處理 {processed_count} 張圖片，成功 {success_count} 張")
-        messagebox.showinfo("完成", f"批次處理完成！\n已處理 {processed_count} 張圖片，成功 {success_count} 張。\n輸出目錄: {output_dir}")
+        done = "已取消" if progress.cancel.is_set() else "完成"
+        self.log_action("批次浮水印", done, f"已處理 {processed_count} 張圖片，成功 {success_count} 張")
+        messagebox.showinfo(done, f"批次處理{done}！\n已處理 {processed_count} 張圖片，成功 {success_count} 張。\n輸出目錄: {output_dir}")
+
+    def batch_embed_lsb(self):
+        """依清單檔（CSV/JSONL：file → payload）批次把加密文字嵌入多張圖片"""
+        key = self.aes_key_entry.get()
+        if len(key) != 16:
+            self.log_action("批次LSB", "失敗", "密鑰長度不為16")
+            return messagebox.showerror("錯誤", "請輸入長度為16的加密密鑰")
+
+        manifest = filedialog.askopenfilename(title="選擇批次 LSB 清單", filetypes=[("清單檔", "*.csv;*.jsonl")])
+        if not manifest:
+            return
+        output_dir = filedialog.askdirectory(title="選擇嵌入後圖片的儲存目錄")
+        if not output_dir:
+            return
+
+        try:
+            entries = batch_engine.read_manifest(manifest)
+        except Exception as e:
+            self.log_action("批次LSB", "失敗", f"清單讀取錯誤: {str(e)}")
+            return messagebox.showerror("錯誤", f"清單讀取錯誤: {str(e)}")
+        if not entries:
+            self.log_action("批次LSB", "失敗", "清單中沒有資料")
+            return messagebox.showwarning("警告", "清單中沒有資料")
+
+        # 創建進度窗口
+        progress = ProgressWindow(self.root, "批次LSB進度", "正在嵌入...", f"0/{len(entries)} 已完成")
+        progress.update()
+
+        # 以多程序平行嵌入，每個檔案的容量使用情形寫入摘要檔
+        processed_count = 0
+        success_count = 0
+        used_total = 0
+
+        results = batch_engine.run_lsb_batch(entries, output_dir, key, self.compress_mode.get(), self.lsb_depth.get(),
+                                             self.scatter_mode.get(), workers=self.batch_workers,
+                                             on_idle=progress.update)
+        for result in results:
+            name = Path(result.name).name
+            if result.ok:
+                success_count += 1
+                used_total += result.used
+            else:
+                self.log_action("批次LSB", "失敗", f"處理 {name} 時出錯: {result.message}")
+
+            processed_count += 1
+            # 每 100 筆更新一次畫面，避免大量檔案時拖慢處理速度
+            if processed_count % 100 == 0 or processed_count == len(entries):
+                progress.show(f"已處理: {name}", f"{processed_count}/{len(entries)} 已完成",
+                              processed_count / len(entries))
+                progress.update()
+            if progress.cancel.is_set():
+                results.close()
+                break
+
+        progress.close()
+
+        summary = Path(output_dir) / batch_engine.LSB_SUMMARY_NAME
+        done = "已取消" if progress.cancel.is_set() else "完成"
+        self.log_action("批次LSB", done, f"已處理 {processed_count} 個檔案，成功 {success_count} 個，"
+                                        f"共嵌入 {used_total} bytes，摘要: {summary}")
+        messagebox.showinfo(done, f"批次LSB嵌入{done}！\n已處理 {processed_count} 個檔案，成功 {success_count} 個。\n"
+                                  f"各檔案容量使用情形: {summary}")
+
+    def scan_lsb_folder(self):
+        """掃描資料夾（含子資料夾）中含有 LSB 資料的圖片，結果寫入 JSONL 報告；有密鑰時一併解密文字"""
+        root_dir = filedialog.askdirectory(title="選擇要掃描的資料夾")
+        if not root_dir:
+            return
+        report = filedialog.asksaveasfilename(title="儲存掃描報告", defaultextension=".jsonl",
+                                              filetypes=[("JSONL", "*.jsonl")])
+        if not report:
+            return
+
+        # 未輸入密鑰時只偵測標頭，不解密
+        key = self.aes_key_entry.get()
+        if key and len(key) != 16:
+            self.log_action("掃描LSB", "失敗", "密鑰長度不為16")
+            return messagebox.showerror("錯誤", "請輸入長度為16的加密密鑰，或留空只偵測是否含有資料")
+
+        # 掃描前不知道檔案總數，不顯示進度條
+        progress = ProgressWindow(self.root, "LSB掃描進度", "正在掃描...", "已掃描 0 張", bar=False, geometry="400x140")
+        progress.update()
+
+        scanned = 0
+        hits = 0
+        errors = 0
+        results = batch_engine.run_scan(root_dir, report, key or None, workers=self.batch_workers,
+                                        on_idle=progress.update)
+        for result in results:
+            scanned += 1
+            if result.hit:
+                hits += 1
+                detail = f"{result.path}: {result.text}" if result.text is not None else result.path
+                self.log_action("掃描LSB", "命中", detail + (f"（{result.error}）" if result.error else ""))
+            elif result.error:
+                errors += 1
+
+            # 未命中的檔案掃描很快，每 500 張更新一次畫面
+            if scanned % 500 == 0:
+                progress.show(f"已掃描: {Path(result.path).name}", f"已掃描 {scanned} 張，命中 {hits} 張")
+                progress.update()
+            if progress.cancel.is_set():
+                results.close()
+                break
+
+        progress.close()
+
+        done = "已取消" if progress.cancel.is_set() else "完成"
+        self.log_action("掃描LSB", done, f"已掃描 {scanned} 張，命中 {hits} 張，無法讀取 {errors} 張，報告: {report}")
+        messagebox.showinfo(done, f"LSB掃描{done}！\n已掃描 {scanned} 張，命中 {hits} 張。\n報告: {report}")
+
+    def analyze_lsb_statistics(self):
+        """不需原圖，以卡方攻擊、RS 分析與樣本對分析估計圖片的 LSB 嵌入率，並顯示各區塊的估計值"""
+        path = filedialog.askopenfilename(title="選擇要分析的圖片")
+        if not path:
+            return
+
+        # 解碼與分析都在背景執行，結果為 (影像, StegoReport)
+        def work(progress, cancel):
+            img = cv2.imread(path)
+            if img is None:
+                raise ValueError(f"無法載入圖片 {path}")
+            return img, steganalysis.analyze(img, progress=progress, cancel=cancel)
+
+        self.run_background("LSB盲偵測", work, lambda result, error: self._show_steganalysis(path, result, error),
+                            message="正在計算LSB統計量...")
+
+    def _show_steganalysis(self, path, found, error):
+        """顯示盲偵測結果：整張圖片的估計值與各方法的區塊熱度圖"""
+        if isinstance(error, ExtractionCancelled):
+            return self.log_action("LSB盲偵測", "取消", "使用者取消分析")
+        if error is not None:
+            self.log_action("LSB盲偵測", "失敗", f"處理錯誤: {str(error)}")
+            return messagebox.showerror("錯誤", f"處理錯誤: {str(error)}")
+        img, report = found
+
+        result = Toplevel(self.root)
+        result.title("LSB盲偵測分析")
+        frame = Frame(result)
+        frame.pack(fill=BOTH, expand=True, padx=10, pady=10)
+
+        # 縮圖與熱度圖同寬，熱度圖以最近鄰放大保留區塊邊界
+        max_width = 300
+        new_height = max(1, int(img.shape[0] * max_width / img.shape[1]))
+        panels = [("分析圖片", cv2.resize(img, (max_width, new_height), interpolation=cv2.INTER_AREA))]
+        names = ("卡方攻擊", "RS分析", "樣本對分析")
+        for i, name in enumerate(names):
+            heat = cv2.applyColorMap((report.tiles[:, :, i] * 255).astype(np.uint8), cv2.COLORMAP_JET)
+            panels.append((f"{name}（區塊）", cv2.resize(heat, (max_width, new_height), interpolation=cv2.INTER_NEAREST)))
+
+        for column, (title, panel) in enumerate(panels):
+            panel_tk = ImageTk.PhotoImage(Image.fromarray(cv2.cvtColor(panel, cv2.COLOR_BGR2RGB)))
+            panel_frame = LabelFrame(frame, text=title)
+            panel_frame.grid(row=0, column=column, padx=5, pady=5)
+            panel_label = Label(panel_frame, image=panel_tk)
+            panel_label.image = panel_tk  # 保持引用
+            panel_label.pack(padx=5, pady=5)
+
+        stats_frame = LabelFrame(result, text="估計嵌入率（藍 0% → 紅 100%）")
+        stats_frame.pack(fill=X, padx=10, pady=10)
+        tile_max = report.tiles.reshape(-1, 3).max(axis=0)
+        stats_text = "\n".join(f"{name}: 整張 {rate * 100:.1f}%，區塊最高 {peak * 100:.1f}%"
+                               for name, rate, peak in zip(names, report.overall, tile_max))
+        stats_text += f"\n區塊大小: {report.tile_size}x{report.tile_size}"
+        Label(stats_frame, text=stats_text, justify=LEFT, padx=10, pady=10).pack()
+
+        overall = report.overall
+        self.log_action("LSB盲偵測", "成功", f"{Path(path).name}: 卡方 {overall.chi_square * 100:.1f}%，"
+                                            f"RS {overall.rs * 100:.1f}%，SPA {overall.spa * 100:.1f}%")
 
     def show_lsb_difference(self):
         """顯示原圖和LSB修改後的圖片差異"""
@@ -1064,95 +1392,80 @@ class WatermarkApp:
         lsb_path = filedialog.askopenfilename(title="選擇LSB處理後的圖片")
         if not lsb_path: 
             return
-            
+
         try:
-            # 讀取兩張圖片
-            original_img = cv2.imread(original_path)
-            lsb_img = cv2.imread(lsb_path)
-            
-            if original_img is None or lsb_img is None:
-                self.log_action("顯示LSB差異", "失敗", "無法載入圖片")
-                return messagebox.showerror("錯誤", "無法載入圖片")
-                
-            # 確保兩張圖片大小相同
-            if original_img.shape != lsb_img.shape:
-                self.log_action("顯示LSB差異", "失敗", "兩張圖片尺寸不同")
-                return messagebox.showerror("錯誤", "兩張圖片尺寸不同，無法比較")
-                
-            # 計算差異圖
-            diff = cv2.absdiff(original_img, lsb_img)
-            
-            # 增強差異以便觀察
-            enhanced_diff = diff * 20
-            
-            # 創建一個視窗顯示差異
-            result = Toplevel(self.root)
-            result.title("LSB差異分析")
-            
-            # 使用 PIL 處理圖像
-            original_pil = Image.fromarray(cv2.cvtColor(original_img, cv2.COLOR_BGR2RGB))
-            lsb_pil = Image.fromarray(cv2.cvtColor(lsb_img, cv2.COLOR_BGR2RGB))
-            diff_pil = Image.fromarray(cv2.cvtColor(enhanced_diff, cv2.COLOR_BGR2RGB))
-            
-            # 縮放圖像以適應窗口
-            max_width = 300
-            width_percent = max_width/float(original_pil.size[0])
-            new_height = int(float(original_pil.size[1])*float(width_percent))
-            
-            original_pil = original_pil.resize((max_width, new_height), Image.LANCZOS)
-            lsb_pil = lsb_pil.resize((max_width, new_height), Image.LANCZOS)
-            diff_pil = diff_pil.resize((max_width, new_height), Image.LANCZOS)
-            
-            # 轉換為 ImageTk 格式
-            original_tk = ImageTk.PhotoImage(original_pil)
-            lsb_tk = ImageTk.PhotoImage(lsb_pil)
-            diff_tk = ImageTk.PhotoImage(diff_pil)
-            
-            # 創建標籤顯示圖像
-            frame = Frame(result)
-            frame.pack(fill=BOTH, expand=True, padx=10, pady=10)
-            
-            # 原圖
-            original_frame = LabelFrame(frame, text="原始圖片")
-            original_frame.grid(row=0, column=0, padx=5, pady=5)
-            original_label = Label(original_frame, image=original_tk)
-            original_label.image = original_tk  # 保持引用
-            original_label.pack(padx=5, pady=5)
-            
-            # LSB圖
-            lsb_frame = LabelFrame(frame, text="LSB圖片")
-            lsb_frame.grid(row=0, column=1, padx=5, pady=5)
-            lsb_label = Label(lsb_frame, image=lsb_tk)
-            lsb_label.image = lsb_tk  # 保持引用
-            lsb_label.pack(padx=5, pady=5)
-            
-            # 差異圖
-            diff_frame = LabelFrame(frame, text="差異 (x20)")
-            diff_frame.grid(row=0, column=2, padx=5, pady=5)
-            diff_label = Label(diff_frame, image=diff_tk)
-            diff_label.image = diff_tk  # 保持引用
-            diff_label.pack(padx=5, pady=5)
-            
-            # 差異統計
-            non_zero = np.count_nonzero(diff)
-            total_pixels = diff.shape[0] * diff.shape[1] * diff.shape[2]
-            change_percent = (non_zero / total_pixels) * 100
-            
-            stats_frame = LabelFrame(result, text="差異統計")
-            stats_frame.pack(fill=X, padx=10, pady=10)
-            
-            stats_text = f"總像素數: {total_pixels}\n" \
-                         f"變更像素數: {non_zero}\n" \
-                         f"變更百分比: {change_percent:.5f}%"
-            
-            stats_label = Label(stats_frame, text=stats_text, justify=LEFT, padx=10, pady=10)
-            stats_label.pack()
-            
-            self.log_action("顯示LSB差異", "成功", f"差異像素: {non_zero}/{total_pixels} ({change_percent:.5f}%)")
-            
-        except Exception as e:
-            self.log_action("顯示LSB差異", "失敗", f"處理時出錯: {str(e)}")
-            messagebox.showerror("錯誤", f"處理LSB差異時出錯: {str(e)}")
+            # 只讀取檔頭；像素逐條帶讀取，大型圖片也不會整張載入兩次
+            original_reader = tiled.StripReader(original_path)
+            lsb_reader = tiled.StripReader(lsb_path)
+        except Exception:
+            self.log_action("顯示LSB差異", "失敗", "無法載入圖片")
+            return messagebox.showerror("錯誤", "無法載入圖片")
+
+        # 確保兩張圖片大小相同
+        if original_reader.shape != lsb_reader.shape:
+            self.log_action("顯示LSB差異", "失敗", "兩張圖片尺寸不同")
+            return messagebox.showerror("錯誤", "兩張圖片尺寸不同，無法比較")
+
+        self.run_background("LSB差異分析",
+                            lambda progress, cancel: tiled.lsb_difference(original_reader, lsb_reader, 300, progress, cancel),
+                            self._show_lsb_difference, message="正在比較兩張圖片...")
+
+    def _show_lsb_difference(self, report, error):
+        """顯示背景計算的差異縮圖、變更密度與各位元平面的統計"""
+        if isinstance(error, ExtractionCancelled):
+            return self.log_action("顯示LSB差異", "取消", "使用者取消分析")
+        if error is not None:
+            self.log_action("顯示LSB差異", "失敗", f"處理時出錯: {str(error)}")
+            return messagebox.showerror("錯誤", f"處理LSB差異時出錯: {str(error)}")
+
+        # 創建一個視窗顯示差異
+        result = Toplevel(self.root)
+        result.title("LSB差異分析")
+        frame = Frame(result)
+        frame.pack(fill=BOTH, expand=True, padx=10, pady=10)
+
+        # 縮圖已在條帶中以面積平均縮小，這裡只放大到顯示寬度；密度圖以最近鄰放大保留區塊邊界
+        max_width = 300
+        new_height = max(1, int(report.original.shape[0] * max_width / report.original.shape[1]))
+        heat = cv2.cvtColor(cv2.applyColorMap((report.density * 255).astype(np.uint8), cv2.COLORMAP_JET), cv2.COLOR_BGR2RGB)
+        panels = [("原始圖片", report.original, Image.LANCZOS), ("LSB圖片", report.modified, Image.LANCZOS),
+                  (f"差異 (x{tiled.DIFF_GAIN})", report.enhanced, Image.LANCZOS),
+                  (f"變更密度（每 {report.block}x{report.block} 區塊）", heat, Image.NEAREST)]
+
+        for column, (title, panel, resample) in enumerate(panels):
+            panel_tk = ImageTk.PhotoImage(Image.fromarray(panel).resize((max_width, new_height), resample))
+            panel_frame = LabelFrame(frame, text=title)
+            panel_frame.grid(row=0, column=column, padx=5, pady=5)
+            panel_label = Label(panel_frame, image=panel_tk)
+            panel_label.image = panel_tk  # 保持引用
+            panel_label.pack(padx=5, pady=5)
+
+        # 差異統計
+        non_zero = int(report.channel_counts.sum())
+        change_percent = (non_zero / report.total) * 100
+
+        stats_frame = LabelFrame(result, text="差異統計")
+        stats_frame.pack(fill=X, padx=10, pady=10)
+
+        stats_text = f"總樣本數（像素 x 通道）: {report.total}\n" \
+                     f"變更樣本數: {non_zero}\n" \
+                     f"變更百分比: {change_percent:.5f}%"
+        Label(stats_frame, text=stats_text, justify=LEFT, padx=10, pady=10).pack()
+
+        # 各通道、各位元平面的變更數
+        planes_frame = LabelFrame(result, text="各位元平面變更數（位元 0 為 LSB）")
+        planes_frame.pack(fill=X, padx=10, pady=(0, 10))
+        Label(planes_frame, text="通道").grid(row=0, column=0, padx=4)
+        for bit in range(8):
+            Label(planes_frame, text=f"位元{bit}").grid(row=0, column=bit + 1, padx=4)
+        Label(planes_frame, text="合計").grid(row=0, column=9, padx=4)
+        for row, name in enumerate("RGB", 1):
+            Label(planes_frame, text=name).grid(row=row, column=0, padx=4)
+            for bit in range(8):
+                Label(planes_frame, text=str(report.plane_counts[row - 1, bit])).grid(row=row, column=bit + 1, padx=4)
+            Label(planes_frame, text=str(report.channel_counts[row - 1])).grid(row=row, column=9, padx=4)
+
+        self.log_action("顯示LSB差異", "成功", f"差異樣本: {non_zero}/{report.total} ({change_percent:.5f}%)")
 
 
 # 程式入口點
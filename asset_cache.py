@@ -0,0 +1,141 @@
+"""浮水印素材的 LRU 快取（縮放、調整透明度後的 RGBA 圖片與字型）"""
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageFont
+
+
+def image_nbytes(img):
+    """估算 PIL 圖片佔用的記憶體"""
+    return img.width * img.height * len(img.getbands())
+
+
+class LRUCache:
+    """以項目數與記憶體上限淘汰最久未使用項目的快取，並統計命中次數"""
+
+    def __init__(self, max_items=64, max_bytes=None, sizeof=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key, factory):
+        """取出快取項目，未命中時以 factory() 建立並存入"""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key][0]
+            self.misses += 1
+
+        value = factory()
+        size = self.sizeof(value)
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = (value, size)
+                self.nbytes += size
+                self._evict()
+        return value
+
+    def get(self, key):
+        """取出快取項目，沒有時回傳 None"""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key][0]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """存入項目，取代同一鍵的舊值"""
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self.nbytes += size
+            self._evict()
+
+    def _evict(self):
+        while self._items and (len(self._items) > self.max_items or
+                               (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+            _, (_, size) = self._items.popitem(last=False)
+            self.nbytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """回傳命中、未命中、項目數與記憶體用量"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "items": len(self._items), "bytes": self.nbytes}
+
+
+# 原始浮水印圖（依路徑與修改時間）與縮放後的成品
+source_cache = LRUCache(max_items=8, max_bytes=256 << 20, sizeof=image_nbytes)
+sprite_cache = LRUCache(max_items=128, max_bytes=256 << 20, sizeof=image_nbytes)
+# 已解析的字型物件，整個程序共用
+font_cache = LRUCache(max_items=32)
+# QR code 模組矩陣與已調整大小、透明度的成品
+qr_matrix_cache = LRUCache(max_items=256)
+qr_sprite_cache = LRUCache(max_items=128, max_bytes=64 << 20, sizeof=image_nbytes)
+
+
+def _file_key(path):
+    path = os.fspath(path)
+    return path, os.stat(path).st_mtime_ns
+
+
+def load_watermark(path):
+    """讀取 RGBA 浮水印原圖，檔案修改後自動重新載入"""
+    key = _file_key(path)
+
+    def load():
+        with Image.open(key[0]) as img:
+            return img.convert("RGBA")
+
+    return source_cache.get_or_create(key, load)
+
+
+def watermark_sprite(path, size, alpha, adjust):
+    """取得縮放到 size 並以 adjust(img, alpha) 調整透明度的浮水印，相同參數只計算一次"""
+    key = _file_key(path) + (tuple(size), alpha, adjust.__name__)
+
+    def build():
+        wm = load_watermark(path)
+        if wm.size == tuple(size):
+            wm = wm.copy()
+        else:
+            wm = wm.resize(tuple(size), Image.LANCZOS)
+        return adjust(wm, alpha)
+
+    return sprite_cache.get_or_create(key, build)
+
+
+def get_font(path, size, index=0):
+    """取得 TrueType 字型，相同 (路徑, 大小, index) 只解析一次"""
+    key = (os.fspath(path), size, index)
+    return font_cache.get_or_create(key, lambda: ImageFont.truetype(key[0], size, index=index))
+
+
+def preload_font(path, sizes):
+    """預先載入字型的常用大小，失敗時留待實際使用時再回報"""
+    for size in sizes:
+        try:
+            get_font(path, size)
+        except Exception:
+            return
+
+
+def cache_stats():
+    """回傳各快取的統計"""
+    return {"source": source_cache.stats(), "sprite": sprite_cache.stats(), "font": font_cache.stats(),
+            "qr_matrix": qr_matrix_cache.stats(), "qr_sprite": qr_sprite_cache.stats()}
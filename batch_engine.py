@@ -0,0 +1,329 @@
+"""以多程序平行處理的批次浮水印引擎"""
+import csv
+import json
+import logging
+import os
+from collections import namedtuple
+from itertools import islice
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import cv2
+from PIL import Image
+
+import asset_cache
+import lsb_scan
+import steganalysis
+import watermark_core as core
+from lsb_engine import FLAG_AEAD, FLAG_ENCRYPTED, FLAG_IMAGE, FLAG_SCATTER
+
+logger = logging.getLogger('watermark_app.batch')
+
+SUPPORTED_FORMATS = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
+# LSB 只能存成無損格式，其他格式一律輸出 PNG
+LOSSLESS_FORMATS = ['.png', '.bmp', '.tif', '.tiff']
+# 批次 LSB 的摘要檔名
+LSB_SUMMARY_NAME = 'lsb_summary.csv'
+# 掃描時每個任務處理的檔案數；未命中的檔案只需數十微秒，逐張傳遞的成本會高於掃描本身
+SCAN_BATCH_SIZE = 64
+
+ManifestEntry = namedtuple('ManifestEntry', 'source output payload')
+LsbResult = namedtuple('LsbResult', 'name ok message used capacity output')
+# overall 與 tile_max 為 steganalysis.StegoEstimate：整張圖片的估計值與各區塊的最大值
+StegoResult = namedtuple('StegoResult', 'name ok message overall tile_max')
+
+# 每個工作程序共用的資源（參數、字型、浮水印圖），只在初始化時載入一次
+_worker = {}
+
+
+def find_images(input_dir):
+    """列出目錄中所有支援的圖片檔"""
+    image_files = []
+    for ext in SUPPORTED_FORMATS:
+        image_files.extend(Path(input_dir).glob(f'*{ext}'))
+        image_files.extend(Path(input_dir).glob(f'*{ext.upper()}'))
+    return list(dict.fromkeys(image_files))  # 不分大小寫的檔案系統會重複列出
+
+
+def _init_worker(params, wm_image_path):
+    _worker['params'] = params
+    _worker['font'] = core.load_font(params.font_path, params.font_size)
+    _worker['wm'] = None
+    if wm_image_path:
+        try:
+            # 預先載入原圖；各尺寸的縮放結果由 asset_cache 在此程序內快取
+            asset_cache.load_watermark(wm_image_path)
+            _worker['wm'] = wm_image_path
+        except Exception as e:
+            logger.warning(f'浮水印圖片載入失敗: {str(e)}')
+
+
+def _process_file(img_path, output_dir):
+    """在工作程序中處理單張圖片，回傳 (檔名, 是否成功, 訊息)"""
+    name = Path(img_path).name
+    try:
+        with Image.open(img_path) as img:
+            result = core.render_batch_watermark(img, _worker['params'], _worker['font'], _worker['wm'])
+        result.save(Path(output_dir) / name)
+        return name, True, ""
+    except Exception as e:
+        return name, False, str(e)
+
+
+def _make_pool(workers, params, wm_image_path):
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(params, wm_image_path))
+
+
+def run_batch(image_files, output_dir, params, wm_image_path="", workers=None, max_in_flight=None,
+              on_idle=None, poll_interval=0.1):
+    """平行處理圖片，每完成一張就產生一筆 (檔名, 是否成功, 訊息)"""
+    jobs = ((Path(img_path).name, (str(img_path), str(output_dir))) for img_path in image_files)
+    yield from _run_parallel(jobs, _process_file, lambda n: _make_pool(n, params, wm_image_path),
+                             lambda name, error: (name, False, error), workers, max_in_flight, on_idle, poll_interval)
+
+
+def _run_parallel(jobs, task, make_pool, failed, workers=None, max_in_flight=None, on_idle=None, poll_interval=0.1):
+    """以程序池執行 jobs 中的 (名稱, 參數) 並依完成順序產生 task 的結果；
+    工作程序崩潰等無法取得結果的任務以 failed(名稱, 訊息) 產生結果，受崩潰波及的其他任務會重新執行"""
+    # 在途任務數以 max_in_flight 為上限，讓記憶體用量維持固定；
+    # 等待期間每隔 poll_interval 秒呼叫 on_idle，讓 GUI 持續更新
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    jobs = iter(jobs)
+    pending = {}
+    pool = make_pool(workers)
+
+    try:
+        while True:
+            # 補滿在途任務
+            while len(pending) < max_in_flight:
+                job = next(jobs, None)
+                if job is None:
+                    break
+                name, args = job
+                pending[pool.submit(task, *args)] = job
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            if not done and on_idle:
+                on_idle()
+
+            suspects = []
+            for future in done:
+                name, args = pending.pop(future)
+                try:
+                    yield future.result()
+                except BrokenProcessPool:
+                    suspects.append((name, args))
+                except Exception as e:
+                    yield failed(name, str(e))
+
+            # 程序池崩潰時所有在途任務都會失敗，無法得知是哪一個造成的；
+            # 這些任務改為逐一在單獨的工作程序中重新執行，只有真正崩潰的任務回報失敗
+            if suspects:
+                suspects += pending.values()
+                pending.clear()
+                pool.shutdown(wait=False, cancel_futures=True)
+                yield from _run_isolated(suspects, task, make_pool, failed, on_idle, poll_interval)
+                pool = make_pool(workers)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _run_isolated(jobs, task, make_pool, failed, on_idle=None, poll_interval=0.1):
+    """在只有一個工作程序的程序池中逐一執行 jobs，程序崩潰時只有當時的任務失敗，並重建程序池"""
+    pool = make_pool(1)
+    try:
+        for name, args in jobs:
+            future = pool.submit(task, *args)
+            while not wait([future], timeout=poll_interval).done:
+                if on_idle:
+                    on_idle()
+            try:
+                yield future.result()
+            except BrokenProcessPool as e:
+                yield failed(name, f"工作程序異常結束: {str(e)}")
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = make_pool(1)
+            except Exception as e:
+                yield failed(name, str(e))
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _lsb_output_path(source, base_dir):
+    """輸出路徑（相對於輸出目錄）：保留清單目錄下的子目錄結構，有損格式改為 .png"""
+    source = Path(source)
+    try:
+        rel = source.resolve().relative_to(Path(base_dir).resolve())
+    except ValueError:
+        rel = Path(source.name)
+    if rel.suffix.lower() not in LOSSLESS_FORMATS:
+        rel = rel.with_suffix('.png')
+    return rel
+
+
+def read_manifest(path):
+    """讀取批次 LSB 清單，回傳 ManifestEntry 串列；相對路徑以清單所在目錄為準。
+    CSV 需有 file、payload 欄位；JSONL 每行為 {"file": ..., "payload": ...}"""
+    path = Path(path)
+    base = path.parent
+    if path.suffix.lower() in ('.jsonl', '.ndjson'):
+        with open(path, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.DictReader(f))
+
+    entries = []
+    outputs = set()
+    for number, row in enumerate(rows, 1):
+        if not row.get('file') or row.get('payload') is None:
+            raise ValueError(f"清單第 {number} 筆缺少 file 或 payload 欄位")
+        source = Path(row['file'])
+        if not source.is_absolute():
+            source = base / source
+        output = _lsb_output_path(source, base)
+        if output in outputs:
+            raise ValueError(f"清單第 {number} 筆的輸出檔名重複: {output}")
+        outputs.add(output)
+        entries.append(ManifestEntry(str(source), str(output), str(row['payload'])))
+    return entries
+
+
+def _init_lsb_worker(key, compress, depth, scatter):
+    _worker['lsb'] = (key, compress, depth, scatter)
+
+
+def _embed_file(source, output, payload, output_dir):
+    """在工作程序中把單筆資料嵌入圖片，回傳 LsbResult"""
+    key, compress, depth, scatter = _worker['lsb']
+    name = source
+    try:
+        img = cv2.imread(source)
+        if img is None:
+            raise ValueError("無法載入圖片")
+        out, used, capacity = core.embed_lsb_text(img, payload, key, compress, depth, scatter)
+        target = Path(output_dir) / output
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if not cv2.imwrite(str(target), out):
+            raise ValueError(f"無法寫入 {target}")
+        return LsbResult(name, True, "", used, capacity, str(output))
+    except Exception as e:
+        return LsbResult(name, False, str(e), 0, 0, str(output))
+
+
+def run_lsb_batch(entries, output_dir, key, compress=True, depth=1, scatter=False, workers=None,
+                  max_in_flight=None, on_idle=None, poll_interval=0.1):
+    """平行把清單中每筆資料加密後嵌入對應圖片並寫到 output_dir，每完成一筆就產生一筆 LsbResult；
+    同時將每個檔案的容量使用情形寫入 output_dir 下的 lsb_summary.csv"""
+    core.check_aes_key(key)
+    jobs = ((e.source, (e.source, e.output, e.payload, str(output_dir))) for e in entries)
+    results = _run_parallel(jobs, _embed_file,
+                            lambda n: ProcessPoolExecutor(max_workers=n, initializer=_init_lsb_worker,
+                                                          initargs=(key, compress, depth, scatter)),
+                            lambda name, error: LsbResult(name, False, error, 0, 0, ""),
+                            workers, max_in_flight, on_idle, poll_interval)
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    with open(Path(output_dir) / LSB_SUMMARY_NAME, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file', 'output', 'status', 'used_bytes', 'capacity_bytes', 'usage_percent', 'message'])
+        for result in results:
+            usage = f"{result.used / result.capacity * 100:.2f}" if result.capacity else ""
+            writer.writerow([result.name, result.output, "ok" if result.ok else "failed",
+                             result.used, result.capacity, usage, result.message])
+            yield result
+
+
+def find_images_recursive(root):
+    """依序列出目錄樹中所有無損格式的圖片；有損格式無法保留 LSB 資料，不必掃描"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in LOSSLESS_FORMATS:
+                yield os.path.join(dirpath, filename)
+
+
+def _batched(items, size):
+    items = iter(items)
+    while batch := tuple(islice(items, size)):
+        yield batch
+
+
+def _init_scan_worker(key):
+    _worker['scan_key'] = key
+
+
+def _scan_files(paths):
+    """在工作程序中掃描一批圖片，回傳 ScanResult 串列"""
+    return [lsb_scan.scan_file(path, _worker['scan_key']) for path in paths]
+
+
+def _scan_record(result):
+    """報告中的一筆 JSON 資料"""
+    record = {'file': result.path, 'hit': result.hit}
+    header = result.header
+    if header is not None:
+        record.update(kind='image' if header.flags & FLAG_IMAGE else 'text', depth=header.depth, length=header.length,
+                      encrypted=bool(header.flags & (FLAG_ENCRYPTED | FLAG_AEAD)),
+                      scattered=bool(header.flags & FLAG_SCATTER))
+    if result.text is not None:
+        record['id'] = result.text
+    if result.error:
+        record['error'] = result.error
+    return record
+
+
+def run_scan(root, report_path, key=None, workers=None, max_in_flight=None, on_idle=None, poll_interval=0.1):
+    """平行掃描 root 目錄樹中的圖片是否含有 LSB 資料，每掃描完一張就產生一筆 ScanResult；
+    命中或讀取失敗的檔案寫入 JSONL 報告，提供 key 時一併記錄解密出的文字"""
+    if key is not None:
+        core.check_aes_key(key)
+    jobs = ((batch, (batch,)) for batch in _batched(find_images_recursive(root), SCAN_BATCH_SIZE))
+    results = _run_parallel(jobs, _scan_files,
+                            lambda n: ProcessPoolExecutor(max_workers=n, initializer=_init_scan_worker, initargs=(key,)),
+                            lambda batch, error: [lsb_scan.ScanResult(path, False, None, None, error) for path in batch],
+                            workers, max_in_flight, on_idle, poll_interval)
+
+    with open(report_path, 'w', encoding='utf-8') as f:
+        for batch in results:
+            for result in batch:
+                if result.hit or result.error:
+                    f.write(json.dumps(_scan_record(result), ensure_ascii=False) + '\n')
+                yield result
+
+
+def _analyze_file(path, tile_size):
+    """在工作程序中估計單張圖片的嵌入率，回傳 StegoResult"""
+    try:
+        img = cv2.imread(path)
+        if img is None:
+            raise ValueError("無法載入圖片")
+        report = steganalysis.analyze(img, tile_size)
+        tile_max = steganalysis.StegoEstimate(*report.tiles.reshape(-1, 3).max(axis=0).tolist())
+        return StegoResult(path, True, "", report.overall, tile_max)
+    except Exception as e:
+        return StegoResult(path, False, str(e), None, None)
+
+
+def run_steganalysis(root, report_path, tile_size=steganalysis.TILE_SIZE, workers=None, max_in_flight=None,
+                     on_idle=None, poll_interval=0.1):
+    """平行估計 root 目錄樹中每張圖片的 LSB 嵌入率，每完成一張就產生一筆 StegoResult，
+    並將整張圖片與區塊最大值的卡方、RS、SPA 估計寫入 CSV 報告"""
+    jobs = ((path, (path, tile_size)) for path in find_images_recursive(root))
+    results = _run_parallel(jobs, _analyze_file, lambda n: ProcessPoolExecutor(max_workers=n),
+                            lambda name, error: StegoResult(name, False, error, None, None),
+                            workers, max_in_flight, on_idle, poll_interval)
+
+    with open(report_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file', 'status', 'chi_square', 'rs', 'spa',
+                         'tile_max_chi_square', 'tile_max_rs', 'tile_max_spa', 'message'])
+        for result in results:
+            rates = [f"{rate:.4f}" for rate in result.overall + result.tile_max] if result.ok else [""] * 6
+            writer.writerow([result.name, "ok" if result.ok else "failed", *rates, result.message])
+            yield result
@@ -0,0 +1,156 @@
+"""只在浮水印外框範圍內合成的合成器，避免配置整張圖大小的疊加層"""
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# bbox 為 (x0, y0, x1, y1)；render(overlay, ox, oy) 以 (ox, oy) 為原點把元素畫到小疊加層上
+Element = namedtuple('Element', 'bbox render')
+# 一組元素與合成方式：paste 為 True 時直接貼上，否則畫在以 background 為底的疊加層後合成
+Layer = namedtuple('Layer', 'elements paste background')
+
+
+def text_element(xy, text, font, fill):
+    """文字元素，外框由 textbbox 計算"""
+    bbox = ImageDraw.Draw(Image.new("RGBA", (1, 1))).textbbox(xy, text, font=font)
+    # 多留 1 像素，涵蓋反鋸齒邊緣
+    bbox = (bbox[0] - 1, bbox[1] - 1, bbox[2] + 1, bbox[3] + 1)
+
+    def render(overlay, ox, oy):
+        ImageDraw.Draw(overlay).text((xy[0] - ox, xy[1] - oy), text, font=font, fill=fill)
+
+    return Element(bbox, render)
+
+
+def scaled_text_element(xy, text, font, fill, scale):
+    """以原圖字級繪製文字遮罩後依 scale 縮小的文字元素，xy 與 font 皆為原圖尺度；
+    FreeType 逐字把字寬取整，直接以縮小的字級繪製時整行寬度會累積誤差"""
+    x0, y0, x1, y1 = ImageDraw.Draw(Image.new("L", (1, 1))).textbbox(xy, text, font=font)
+    mask = Image.new("L", (max(1, x1 - x0), max(1, y1 - y0)), 0)
+    ImageDraw.Draw(mask).text((xy[0] - x0, xy[1] - y0), text, font=font, fill=255)
+    left, top = int(round(x0 * scale)), int(round(y0 * scale))
+    size = (max(1, int(round(x1 * scale)) - left), max(1, int(round(y1 * scale)) - top))
+    mask = mask.resize(size, Image.BOX)
+    ink = Image.new("RGBA", size, fill)
+
+    def render(overlay, ox, oy):
+        overlay.paste(ink, (left - ox, top - oy), mask)
+
+    return Element((left, top, left + size[0], top + size[1]), render)
+
+
+def sprite_element(sprite, pos):
+    """以自身 alpha 為遮罩貼上的 RGBA 圖片元素"""
+    x, y = pos
+
+    def render(overlay, ox, oy):
+        overlay.paste(sprite, (x - ox, y - oy), sprite)
+
+    return Element((x, y, x + sprite.width, y + sprite.height), render)
+
+
+def _clip(bbox, width, height):
+    x0, y0, x1, y1 = bbox
+    x0, y0 = max(0, int(x0)), max(0, int(y0))
+    x1, y1 = min(width, int(x1)), min(height, int(y1))
+    return (x0, y0, x1, y1) if x0 < x1 and y0 < y1 else None
+
+
+def union_bbox(a, b):
+    """兩個外框的聯集，任一為 None 時回傳另一個"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def layer_bbox(layer, width, height):
+    """圖層在 width x height 畫面上會改動的範圍，沒有元素落在畫面內時回傳 None"""
+    bbox = None
+    for element in layer.elements:
+        bbox = union_bbox(bbox, _clip(element.bbox, width, height))
+    return bbox
+
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def group_elements(elements, width, height):
+    """裁切到畫面範圍，並把外框重疊的元素合併成同一組（保持繪製順序）"""
+    groups = []
+    for element in elements:
+        bbox = _clip(element.bbox, width, height)
+        if bbox is None:
+            continue
+        members = [element]
+        # 與既有群組重疊時合併，直到沒有重疊為止
+        merged = True
+        while merged:
+            merged = False
+            for group in groups:
+                if _overlaps(group[0], bbox):
+                    groups.remove(group)
+                    bbox = (min(bbox[0], group[0][0]), min(bbox[1], group[0][1]),
+                            max(bbox[2], group[0][2]), max(bbox[3], group[0][3]))
+                    members = group[1] + members
+                    merged = True
+                    break
+        groups.append((bbox, members))
+    return groups
+
+
+def _region(buf, bbox):
+    x0, y0, x1, y1 = bbox
+    region = Image.fromarray(buf[y0:y1, x0:x1])
+    return region.convert("RGBA") if region.mode != "RGBA" else region
+
+
+def _write_back(buf, bbox, region):
+    x0, y0, x1, y1 = bbox
+    mode = "RGBA" if buf.shape[2] == 4 else "RGB"
+    buf[y0:y1, x0:x1] = np.asarray(region.convert(mode))
+
+
+def composite_elements(buf, elements, background=(0, 0, 0, 0)):
+    """等同於把元素畫到透明疊加層後 alpha_composite，但只處理外框範圍；直接修改 buf"""
+    height, width = buf.shape[:2]
+    for bbox, members in group_elements(elements, width, height):
+        overlay = Image.new("RGBA", (bbox[2] - bbox[0], bbox[3] - bbox[1]), background)
+        for element in members:
+            element.render(overlay, bbox[0], bbox[1])
+        _write_back(buf, bbox, Image.alpha_composite(_region(buf, bbox), overlay))
+    return buf
+
+
+def paste_elements(buf, elements):
+    """等同於把元素直接貼到主圖上，只處理外框範圍；直接修改 buf"""
+    height, width = buf.shape[:2]
+    for bbox, members in group_elements(elements, width, height):
+        region = _region(buf, bbox)
+        for element in members:
+            element.render(region, bbox[0], bbox[1])
+        _write_back(buf, bbox, region)
+    return buf
+
+
+def apply_layer(buf, layer):
+    """依圖層的合成方式把元素畫到 buf 上；直接修改 buf"""
+    if layer.paste:
+        return paste_elements(buf, layer.elements)
+    return composite_elements(buf, layer.elements, layer.background)
+
+
+def offset_element(element, dx, dy):
+    """平移元素座標，用於在分塊的條帶上以條帶自身座標繪製"""
+    x0, y0, x1, y1 = element.bbox
+
+    def render(overlay, ox, oy):
+        element.render(overlay, ox - dx, oy - dy)
+
+    return Element((x0 + dx, y0 + dy, x1 + dx, y1 + dy), render)
+
+
+def offset_layer(layer, dx, dy):
+    return layer._replace(elements=[offset_element(e, dx, dy) for e in layer.elements])
@@ -0,0 +1,78 @@
+"""參數變動時的防抖動背景重繪"""
+import queue
+import threading
+import time
+
+
+class LiveRenderer:
+    """在背景執行緒重繪預覽：短時間內連續的請求只執行最後一次，過時的結果直接丟棄"""
+
+    def __init__(self, delay=0.15):
+        self.delay = delay
+        self.results = queue.Queue()
+        self._cond = threading.Condition()
+        self._job = None
+        self._generation = 0
+        self._requested_at = 0.0
+        self._running = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, job):
+        """排入新的重繪工作 job()，取代尚未開始的舊工作；回傳此次請求的編號"""
+        with self._cond:
+            self._generation += 1
+            self._job = job
+            self._requested_at = time.monotonic()
+            self._cond.notify()
+            return self._generation
+
+    def cancel(self):
+        """取消尚未開始的工作，並讓執行中工作的結果作廢"""
+        with self._cond:
+            self._generation += 1
+            self._job = None
+            self._cond.notify()
+
+    @property
+    def busy(self):
+        with self._cond:
+            return self._job is not None or self._running
+
+    def latest(self):
+        """取出最新一筆結果 (編號, 結果, 例外)，沒有時回傳 None"""
+        item = None
+        while True:
+            try:
+                item = self.results.get_nowait()
+            except queue.Empty:
+                return item
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._job is None:
+                    self._cond.wait()
+                # 防抖動：等到最後一次請求後 delay 秒內沒有新請求才開始
+                while self._job is not None:
+                    remaining = self._requested_at + self.delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._job is None:
+                    continue
+                job, generation = self._job, self._generation
+                self._job = None
+                self._running = True
+
+            result, error = None, None
+            try:
+                result = job()
+            except Exception as e:
+                error = e
+
+            # 在鎖內放入結果，busy 變為 False 時結果必定已在佇列中
+            with self._cond:
+                self._running = False
+                if generation == self._generation:
+                    self.results.put((generation, result, error))
@@ -0,0 +1,572 @@
+"""LSB 隱寫的向量化位元引擎"""
+import bz2
+import hashlib
+import lzma
+import math
+import struct
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+import asset_cache
+
+# 舊版格式：資料後接終止標記
+SENTINEL = '1111111111111110'
+SENTINEL_BYTES = int(SENTINEL, 2).to_bytes(len(SENTINEL) // 8, 'big')
+
+# 新版格式：固定長度標頭 + 資料
+# magic(4) | 版本(1) | 旗標(1) | 壓縮格式(1) | 保留(1) | 資料長度(4) | CRC32(4)
+# 壓縮格式原為保留位元組，舊版圖片中為 0（未壓縮）
+MAGIC = b'DWLS'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('>4sBBBxII')
+HEADER_BITS = HEADER.size * 8
+
+FLAG_COMPRESSED = 0x01
+FLAG_ENCRYPTED = 0x02
+FLAG_IMAGE = 0x04
+FLAG_BINARY = 0x08  # 資料為原始位元組，未經 base64 編碼
+# 旗標第 4、5 位元記錄資料區每個通道使用的位元數 - 1；標頭本身固定每通道 1 bit
+DEPTH_SHIFT = 4
+DEPTH_MASK = 0x30
+MAX_DEPTH = 4
+# 資料為 AES-GCM 串流加密（見 stream_cipher），由驗證標籤確保完整性，標頭的 CRC 欄位為 0
+FLAG_AEAD = 0x40
+# 資料樣本依密鑰導出的隨機排列分散在標頭之後的位置，標頭本身仍在最前面
+FLAG_SCATTER = 0x80
+
+ContainerHeader = namedtuple('ContainerHeader', 'version flags codec length crc depth')
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODEC_BZ2 = 3
+CODEC_ZSTD = 4
+
+# 壓縮格式: (名稱, 壓縮, 解壓縮)
+CODECS = {
+    CODEC_ZLIB: ("zlib", lambda data: zlib.compress(data, 9), zlib.decompress),
+    CODEC_LZMA: ("lzma", lambda data: lzma.compress(data, preset=9), lzma.decompress),
+    CODEC_BZ2: ("bz2", lambda data: bz2.compress(data, 9), bz2.decompress),
+}
+
+# zstd 為選用：Python 3.14 內建，舊版需安裝 zstandard
+try:
+    from compression import zstd
+    CODECS[CODEC_ZSTD] = ("zstd", lambda data: zstd.compress(data, 19), zstd.decompress)
+except ImportError:
+    try:
+        import zstandard
+        CODECS[CODEC_ZSTD] = ("zstd", lambda data: zstandard.ZstdCompressor(level=19).compress(data),
+                              lambda data: zstandard.ZstdDecompressor().decompress(data))
+    except ImportError:
+        pass
+
+
+# 壓縮前先以 zlib 最快等級試壓資料開頭、中段與結尾各一段，幾乎沒有變小時（PNG、JPEG 等已壓縮的資料）直接不壓縮
+PROBE_BYTES = 64 * 1024
+PROBE_RATIO = 0.98
+
+
+def _compressible(data):
+    """以少量樣本估計 data 是否值得交給高壓縮等級的格式"""
+    if len(data) <= 3 * PROBE_BYTES:
+        return len(zlib.compress(data, 1)) < len(data) * PROBE_RATIO
+    middle = (len(data) - PROBE_BYTES) // 2
+    sample = data[:PROBE_BYTES] + data[middle:middle + PROBE_BYTES] + data[-PROBE_BYTES:]
+    return len(zlib.compress(sample, 1)) < len(sample) * PROBE_RATIO
+
+
+def compress_payload(data):
+    """以所有可用的格式壓縮並取最小者，回傳 (壓縮格式, 資料)；壓縮後沒有變小時回傳 (CODEC_NONE, 原資料)"""
+    data = bytes(data)
+    best = (CODEC_NONE, data)
+    if not _compressible(data):
+        return best
+    for codec, (_, compress, _) in CODECS.items():
+        packed = compress(data)
+        if len(packed) < len(best[1]):
+            best = (codec, packed)
+    return best
+
+
+def decompress_payload(codec, data):
+    """依標頭記錄的壓縮格式解壓縮"""
+    if codec == CODEC_NONE:
+        return data
+    if codec not in CODECS:
+        raise ValueError(f"不支援的壓縮格式: {codec}（zstd 需安裝 zstandard）")
+    return CODECS[codec][2](data)
+
+
+class ExtractionCancelled(Exception):
+    """讀取 LSB 的過程被使用者取消"""
+
+
+def check_cancel(cancel):
+    """cancel 為 threading.Event 之類的物件，已設定時中止讀取"""
+    if cancel is not None and cancel.is_set():
+        raise ExtractionCancelled("已取消 LSB 讀取")
+
+
+def bytes_to_bits(data):
+    """將位元組轉為 0/1 的 uint8 位元陣列（高位在前，與 text_to_bin 相同順序）"""
+    return np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8))
+
+
+def payload_bits(payload, terminator=SENTINEL_BYTES):
+    """將資料加上終止標記後轉為位元陣列（舊版格式）"""
+    return bytes_to_bits(bytes(payload) + terminator)
+
+
+def capacity_bits(img, depth=1):
+    """載體可用的 LSB 位元數：標頭區每個通道 1 bit，其後每個通道 depth bits"""
+    if img.size <= HEADER_BITS:
+        return img.size
+    return HEADER_BITS + (img.size - HEADER_BITS) * depth
+
+
+def capacity_bytes(img, depth=1):
+    """扣除標頭後可嵌入的資料位元組數"""
+    return max(0, capacity_bits(img, depth) // 8 - HEADER.size)
+
+
+def required_depth(img, nbytes):
+    """可容納 nbytes 資料的最小嵌入深度，超過 MAX_DEPTH 仍放不下時回傳 None"""
+    for depth in range(1, MAX_DEPTH + 1):
+        if nbytes <= capacity_bytes(img, depth):
+            return depth
+    return None
+
+
+def expected_psnr(img, nbytes, depth=1):
+    """估算嵌入 nbytes 隨機資料後的 PSNR (dB)：改寫 d 個最低位元時每個樣本的平均平方誤差為 (4^d - 1) / 6"""
+    samples = -(-nbytes * 8 // depth)
+    mse = (HEADER_BITS * 0.5 + samples * (4 ** depth - 1) / 6) / max(1, img.size)
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+def psnr(original, embedded):
+    """兩張影像的 PSNR (dB)，完全相同時回傳 inf"""
+    diff = original.astype(np.int32) - embedded
+    mse = np.mean(np.square(diff), dtype=np.float64)
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def bits_to_values(bits, depth):
+    """每 depth 個位元組成一個樣本的低位值（先出現的位元在高位），不足時補 0"""
+    bits = np.asarray(bits, dtype=np.uint8)
+    if depth == 1:
+        return bits
+    groups = np.concatenate([bits, np.zeros(-bits.size % depth, dtype=np.uint8)]).reshape(-1, depth)
+    values = np.zeros(groups.shape[0], dtype=np.uint8)
+    for i in range(depth):
+        values |= groups[:, i] << (depth - 1 - i)
+    return values
+
+
+def values_to_bits(samples, depth):
+    """bits_to_values 的反向：取出每個樣本最低 depth 個位元"""
+    if depth == 1:
+        return samples & 1
+    shifts = np.arange(depth - 1, -1, -1, dtype=np.uint8)
+    return ((samples[:, None] >> shifts) & 1).reshape(-1)
+
+
+def embed_bits(img, bits):
+    """將位元陣列依 列→行→通道 的順序寫入最低位元，回傳新的影像"""
+    bits = np.asarray(bits, dtype=np.uint8)
+    if bits.size > img.size:
+        raise ValueError(f"資料過大 ({bits.size}/{img.size} bits)")
+
+    out = img.copy()
+    flat = out.reshape(-1)
+    n = bits.size
+    flat[:n] = (flat[:n] & 0xFE) | bits
+    return out
+
+
+def embed_payload(img, payload, terminator=SENTINEL_BYTES):
+    """將資料與終止標記一次性嵌入載體（舊版格式）"""
+    return embed_bits(img, payload_bits(payload, terminator))
+
+
+# 每個區塊約讀取的位元數，用於決定一次處理幾列
+CHUNK_BITS = 1 << 22
+
+
+def _rows_per_chunk(img):
+    row_bits = img.size // img.shape[0] if img.shape[0] else 1
+    return max(1, CHUNK_BITS // max(1, row_bits))
+
+
+def iter_lsb_chunks(img, rows_per_chunk=None):
+    """以列區塊為單位取出 LSB 位元平面，產生 (起始列, 結束列, 位元陣列)"""
+    h = img.shape[0]
+    step = rows_per_chunk or _rows_per_chunk(img)
+    for r0 in range(0, h, step):
+        r1 = min(h, r0 + step)
+        yield r0, r1, (img[r0:r1] & 1).reshape(-1)
+
+
+def find_sentinel(bits, sentinel=SENTINEL):
+    """在位元陣列中尋找終止標記第一次出現的位置（不需位元組對齊），找不到回傳 -1"""
+    length = len(sentinel)
+    n = bits.size
+    if n < length:
+        return -1
+
+    # 打包後將相鄰三個位元組組成 24 bit，再以 8 種位移比對 16 bit 的標記
+    packed = np.packbits(bits).astype(np.uint32)
+    packed = np.concatenate([packed, np.zeros(2, dtype=np.uint32)])
+    window = (packed[:-2] << 16) | (packed[1:-1] << 8) | packed[2:]
+    target = int(sentinel, 2)
+    mask = (1 << length) - 1
+
+    best = -1
+    for shift in range(8):
+        hits = np.flatnonzero(((window >> (24 - length - shift)) & mask) == target)
+        if hits.size == 0:
+            continue
+        starts = hits * 8 + shift
+        starts = starts[starts + length <= n]  # 排除落在補零區的假匹配
+        if starts.size and (best < 0 or starts[0] < best):
+            best = int(starts[0])
+    return best
+
+
+def extract_until_sentinel(img, sentinel=SENTINEL, rows_per_chunk=None, progress=None, cancel=None):
+    """分塊讀取 LSB，遇到終止標記即停止並回傳其前的資料位元組；找不到回傳 None"""
+    return scan_until_sentinel(iter_lsb_chunks(img, rows_per_chunk), img.shape[0], sentinel, progress, cancel)
+
+
+def scan_until_sentinel(chunks, height, sentinel=SENTINEL, progress=None, cancel=None):
+    """在 (起始列, 結束列, 位元陣列) 區塊序列中尋找終止標記，回傳其前的資料位元組；找不到回傳 None"""
+    h = height
+    length = len(sentinel)
+    consumed = []
+    tail = np.zeros(0, dtype=np.uint8)
+    offset = 0  # tail[0] 在整體位元流中的位置
+
+    for r0, r1, bits in chunks:
+        check_cancel(cancel)
+        window = np.concatenate([tail, bits])
+        pos = find_sentinel(window, sentinel)
+        if pos >= 0:
+            end = offset + pos
+            consumed.append(bits)
+            stream = np.concatenate(consumed)[:end]
+            if progress:
+                progress(1.0)
+            return np.packbits(stream).tobytes()
+
+        consumed.append(bits)
+        keep = min(length - 1, window.size)
+        offset += window.size - keep
+        tail = window[window.size - keep:]
+        if progress:
+            progress(r1 / h)
+    return None
+
+
+def pack_header(length, crc, flags=0, codec=CODEC_NONE, depth=1):
+    """產生記錄資料長度、CRC、壓縮格式與嵌入深度的標頭"""
+    if not 1 <= depth <= MAX_DEPTH:
+        raise ValueError(f"嵌入深度需介於 1 到 {MAX_DEPTH}")
+    if codec != CODEC_NONE:
+        flags |= FLAG_COMPRESSED
+    flags = flags & ~DEPTH_MASK | (depth - 1) << DEPTH_SHIFT
+    return HEADER.pack(MAGIC, FORMAT_VERSION, flags, codec, length, crc)
+
+
+def pack_container(payload, flags=0, codec=CODEC_NONE, depth=1):
+    """在資料前加上含長度與 CRC 的標頭"""
+    payload = bytes(payload)
+    return pack_header(len(payload), zlib.crc32(payload), flags, codec, depth) + payload
+
+
+class StreamPayload:
+    """長度已知、由 chunks() 逐塊產生內容的資料，嵌入時不需要整份放在記憶體中；crc 為標頭記錄的值"""
+
+    def __init__(self, length, chunks, crc=0):
+        self.length = length
+        self.chunks = chunks
+        self.crc = crc
+
+    def __len__(self):
+        return self.length
+
+
+def container_samples_count(length, depth=1):
+    """length 位元組的資料連同標頭需要的樣本數"""
+    return HEADER_BITS + -(-length * 8 // depth)
+
+
+def container_segments(payload, flags=0, codec=CODEC_NONE, depth=1):
+    """依序產生要寫入樣本的 (低位值, 遮罩) 區段：標頭每個通道 1 bit，資料每個通道 depth bits；
+    payload 可為位元組或 StreamPayload"""
+    if isinstance(payload, StreamPayload):
+        length, chunks, crc = payload.length, payload.chunks(), payload.crc
+    else:
+        payload = bytes(payload)
+        length, chunks, crc = len(payload), [payload], zlib.crc32(payload)
+    yield bytes_to_bits(pack_header(length, crc, flags, codec, depth)), np.uint8(1)
+
+    # 區塊邊界不一定落在樣本邊界，剩下的位元併入下一塊
+    mask = np.uint8((1 << depth) - 1)
+    carry = np.zeros(0, dtype=np.uint8)
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+        bits = np.concatenate([carry, bytes_to_bits(chunk)])
+        n = bits.size // depth * depth
+        carry = bits[n:]
+        yield bits_to_values(bits[:n], depth), mask
+    if carry.size:
+        yield bits_to_values(carry, depth), mask
+    if total != length:
+        raise ValueError(f"資料長度與標頭不符 ({total}/{length} bytes)")
+
+
+class SampleWriter:
+    """把 container_segments 的區段依序寫入一段段連續的一維樣本（整張影像或列條帶）"""
+
+    def __init__(self, segments):
+        self._segments = iter(segments)
+        self._values = np.zeros(0, dtype=np.uint8)
+        self._mask = np.uint8(0)
+        self._pos = 0
+        self.written = 0
+
+    def write(self, flat):
+        """依 列→行→通道 的順序改寫 flat 開頭樣本的低位元，回傳改寫的樣本數"""
+        pos = 0
+        while pos < flat.size:
+            if self._pos >= self._values.size:
+                segment = next(self._segments, None)
+                if segment is None:
+                    break
+                (self._values, self._mask), self._pos = segment, 0
+                continue
+            n = min(self._values.size - self._pos, flat.size - pos)
+            flat[pos:pos + n] = (flat[pos:pos + n] & ~self._mask) | self._values[self._pos:self._pos + n]
+            pos += n
+            self._pos += n
+        self.written += pos
+        return pos
+
+
+# 快取最近使用的幾組位置前綴，以項目數與記憶體用量為上限
+_scatter_cache = asset_cache.LRUCache(max_items=4, max_bytes=256 << 20, sizeof=lambda positions: positions.nbytes)
+# Feistel 網路的回合數與每次計算的位置數
+SCATTER_ROUNDS = 6
+SCATTER_CHUNK = 1 << 14
+
+
+def _mix64(z):
+    """splitmix64 的混合函數，直接修改 uint64 陣列 z；乘法溢位即取模 2^64"""
+    z ^= z >> np.uint64(30)
+    z *= np.uint64(0xBF58476D1CE4E5B9)
+    z ^= z >> np.uint64(27)
+    z *= np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    return z
+
+
+def _feistel(x, keys, half):
+    """2^(2*half) 範圍內依 keys 決定的雙射"""
+    mask = np.uint64((1 << half) - 1)
+    left, right = x >> np.uint64(half), x & mask
+    for k in keys:
+        f = _mix64(right ^ k)
+        f &= mask
+        f ^= left
+        left, right = right, f
+    left <<= np.uint64(half)
+    left |= right
+    return left
+
+
+def _permutation_prefix(seed, n, start, stop):
+    """0..n-1 依 seed 決定的排列中第 start..stop-1 項：以 Feistel 網路在不小於 n 的 2 的偶數次方範圍內建立雙射，
+    落在 n 以外的值再套用一次直到回到範圍內（cycle walking）。每一項只取決於 seed 與索引，
+    任何長度的前綴都一致；只用固定的整數運算，寫入的位置不會隨 NumPy 亂數產生器的實作改變"""
+    if stop > n:
+        raise ValueError(f"資料過大 ({stop}/{n} 個樣本)")
+    half = max(1, ((n - 1).bit_length() + 1) // 2)
+    keys = [np.uint64(int.from_bytes(hashlib.sha256(seed + bytes([r])).digest()[:8], 'big'))
+            for r in range(SCATTER_ROUNDS)]
+    out = np.empty(stop - start, dtype=np.int64)
+    # 分塊計算讓暫存陣列留在 CPU 快取中
+    for offset in range(0, stop - start, SCATTER_CHUNK):
+        values = _feistel(np.arange(start + offset, min(stop, start + offset + SCATTER_CHUNK), dtype=np.uint64),
+                          keys, half)
+        walking = np.flatnonzero(values >= n)
+        while walking.size:
+            values[walking] = _feistel(values[walking], keys, half)
+            walking = walking[values[walking] >= n]
+        out[offset:offset + values.size] = values
+    return out
+
+
+def scatter_positions(key, size, count):
+    """依密鑰決定資料樣本的位置：回傳 size 個樣本中標頭之後位置的隨機排列前 count 項。
+    同一組 (密鑰, 樣本數) 的前綴會快取，要求較短的前綴時直接切片，較長時只補算不足的部分"""
+    seed = hashlib.sha256(b'DWLS scatter' + bytes(key)).digest()
+    cache_key = (seed, size)
+    cached = _scatter_cache.get(cache_key)
+    if cached is not None and cached.size >= count:
+        return cached[:count]
+
+    start = 0 if cached is None else cached.size
+    tail = _permutation_prefix(seed, size - HEADER_BITS, start, count) + HEADER_BITS
+    positions = tail if cached is None else np.concatenate([cached, tail])
+    positions.flags.writeable = False
+    _scatter_cache.put(cache_key, positions)
+    return positions
+
+
+def embed_container(img, payload, flags=0, codec=CODEC_NONE, depth=1, scatter_key=None):
+    """以新版標頭格式嵌入資料，回傳新的影像；指定 scatter_key 時資料樣本依密鑰分散寫入"""
+    total = container_samples_count(len(payload), depth)
+    if total > img.size:
+        raise ValueError(f"資料過大 ({total}/{img.size} 個樣本)")
+    out = img.copy()
+    flat = out.reshape(-1)
+    if scatter_key is None:
+        SampleWriter(container_segments(payload, flags, codec, depth)).write(flat)
+        return out
+
+    writer = SampleWriter(container_segments(payload, flags | FLAG_SCATTER, codec, depth))
+    writer.write(flat[:HEADER_BITS])
+    positions = scatter_positions(scatter_key, img.size, total - HEADER_BITS)
+    picked = flat[positions]
+    writer.write(picked)
+    flat[positions] = picked
+    return out
+
+
+def parse_header(data):
+    """解析標頭，magic 不符時回傳 None"""
+    if data is None or len(data) < HEADER.size:
+        return None
+    magic, version, flags, codec, length, crc = HEADER.unpack(data[:HEADER.size])
+    if magic != MAGIC:
+        return None
+    if version > FORMAT_VERSION:
+        raise ValueError(f"不支援的 LSB 格式版本: {version}")
+    depth = ((flags & DEPTH_MASK) >> DEPTH_SHIFT) + 1
+    return ContainerHeader(version, flags, codec, length, crc, depth)
+
+
+class LsbStreamReader:
+    """從樣本區塊序列（列→行→通道順序的一維陣列）依序讀出位元組；
+    depth 為每個樣本讀取的位元數，讀完標頭後依標頭設定"""
+
+    def __init__(self, chunks):
+        self.depth = 1
+        self._chunks = iter(chunks)
+        self._samples = np.zeros(0, dtype=np.uint8)
+        self._bits = np.zeros(0, dtype=np.uint8)
+
+    def _take(self, n):
+        parts = [self._samples] if self._samples.size else []
+        have = self._samples.size
+        while have < n:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            parts.append(chunk)
+            have += chunk.size
+        samples = np.concatenate(parts) if len(parts) > 1 else (parts[0] if parts else self._samples)
+        self._samples = samples[n:]
+        return samples[:n]
+
+    def read(self, count):
+        need = count * 8 - self._bits.size
+        if need > 0:
+            n = -(-need // self.depth)
+            samples = self._take(n)
+            if samples.size < n:
+                return None
+            self._bits = np.concatenate([self._bits, values_to_bits(samples, self.depth)])
+        data = np.packbits(self._bits[:count * 8]).tobytes()
+        self._bits = self._bits[count * 8:]
+        return data
+
+
+class ArrayLsbReader(LsbStreamReader):
+    """依序讀出記憶體中影像的 LSB 位元組"""
+
+    def __init__(self, img):
+        self.flat = img.reshape(-1)
+        super().__init__(self.flat[i:i + CHUNK_BITS] for i in range(0, self.flat.size, CHUNK_BITS))
+
+    def scatter(self, positions):
+        """之後的樣本改依 positions 的順序讀取"""
+        self._samples = np.zeros(0, dtype=np.uint8)
+        self._chunks = (self.flat[positions[i:i + CHUNK_BITS]] for i in range(0, positions.size, CHUNK_BITS))
+
+
+def extract_container(img, progress=None, cancel=None, decoder=None, scatter_key=None):
+    """讀取固定長度標頭後依標頭記錄的長度與深度分塊切出資料，無標頭時回傳 None"""
+    return read_container(ArrayLsbReader(img), img, progress, cancel, decoder, scatter_key)
+
+
+def read_container(reader, carrier, progress=None, cancel=None, decoder=None, scatter_key=None):
+    """以 reader.read(count) 依序讀出標頭與資料，carrier 只需有 size 屬性（樣本數）；無標頭時回傳 None。
+    decoder(header) 可回傳串流解密器（open(read)、update(chunk)、finish()，見 stream_cipher），
+    此時邊讀邊解密，回傳明文與清除 FLAG_ENCRYPTED、FLAG_AEAD 後的標頭。
+    分散嵌入的資料需要 scatter_key，且 reader 需支援 scatter(positions)"""
+    header = parse_header(reader.read(HEADER.size))
+    if header is None:
+        return None
+    if header.length > capacity_bytes(carrier, header.depth):
+        raise ValueError("LSB 資料長度超出圖片容量")
+    reader.depth = header.depth
+    if header.flags & FLAG_SCATTER:
+        if scatter_key is None:
+            raise ValueError("此資料以密鑰分散嵌入，請輸入加密密鑰後再讀取")
+        if not hasattr(reader, "scatter"):
+            raise ValueError("分散嵌入的資料需要整張載入圖片才能讀取")
+        # 只產生資料實際用到的排列前綴
+        count = container_samples_count(header.length, header.depth) - HEADER_BITS
+        reader.scatter(scatter_positions(scatter_key, carrier.size, count))
+
+    # 密鑰錯誤時 open() 只讀取前置資料就會失敗，不必讀完整份資料
+    stream = decoder(header) if decoder is not None else None
+    done = stream.open(reader.read) if stream is not None else 0
+
+    # 進度以資料長度計算，而不是整張圖片
+    step = CHUNK_BITS // 8
+    payload = bytearray()
+    crc = 0
+    for start in range(done, header.length, step):
+        check_cancel(cancel)
+        chunk = reader.read(min(step, header.length - start))
+        crc = zlib.crc32(chunk, crc)
+        payload += stream.update(chunk) if stream is not None else chunk
+        if progress:
+            progress((start + len(chunk)) / header.length)
+    if stream is not None:
+        payload += stream.finish()
+        header = header._replace(flags=header.flags & ~(FLAG_ENCRYPTED | FLAG_AEAD))
+    elif not header.flags & FLAG_AEAD and crc != header.crc:
+        raise ValueError("LSB 資料 CRC 校驗失敗")
+    if progress:
+        progress(1.0)
+    return header, bytes(payload)
+
+
+def extract_payload(img, progress=None, cancel=None, decoder=None, scatter_key=None):
+    """先嘗試新版標頭，失敗時退回舊版終止標記掃描；回傳 (標頭, 資料)，舊版標頭為 None"""
+    found = extract_container(img, progress, cancel, decoder, scatter_key)
+    if found is not None:
+        return found
+
+    # 舊版格式沒有長度資訊，進度只能以整張圖片計算
+    payload = extract_until_sentinel(img, progress=progress, cancel=cancel)
+    if payload is None:
+        return None
+    return None, payload
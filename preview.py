@@ -0,0 +1,76 @@
+"""預覽用的多解析度影像金字塔與代理影像"""
+import cv2
+import numpy as np
+from PIL import Image
+
+# 代理影像的最長邊，編輯時在此尺寸上即時預覽，儲存時才以原圖解析度輸出
+PROXY_MAX_SIDE = 1600
+
+
+def _downsample(src):
+    """以 2x2 區塊平均縮小一半（奇數邊捨去最後一列/行）"""
+    h, w = src.shape[0] // 2, src.shape[1] // 2
+    s = src[:h * 2, :w * 2].astype(np.uint16)
+    out = (s[0::2, 0::2] + s[1::2, 0::2] + s[0::2, 1::2] + s[1::2, 1::2] + 2) >> 2
+    return out.astype(np.uint8)
+
+
+class PreviewPyramid:
+    """載入時建立一次的縮圖金字塔，顯示時從最接近的層級縮放"""
+
+    def __init__(self, image, min_size=128):
+        self.min_size = min_size
+        self.levels = [image]
+        while min(self.levels[-1].shape[:2]) // 2 >= min_size:
+            self.levels.append(_downsample(self.levels[-1]))
+
+    @property
+    def shape(self):
+        return self.levels[0].shape
+
+    def update(self, image, bbox=None):
+        """換上新的影像，只重算 bbox (x0, y0, x1, y1) 範圍內的各層像素，bbox 為 None 時整張重算；
+        尺寸不同時回傳 False"""
+        if image is self.levels[0]:
+            return True
+        if image.shape != self.shape:
+            return False
+        self.levels[0] = image
+        if bbox is None:
+            bbox = (0, 0, image.shape[1], image.shape[0])
+        x0, y0, x1, y1 = bbox
+        if x0 >= x1 or y0 >= y1:
+            return True
+        for k in range(1, len(self.levels)):
+            # 對齊到上一層的偶數邊界後換算到本層座標
+            x0, y0 = x0 // 2, y0 // 2
+            x1 = min(self.levels[k].shape[1], (x1 + 1) // 2)
+            y1 = min(self.levels[k].shape[0], (y1 + 1) // 2)
+            src = self.levels[k - 1][y0 * 2:y1 * 2, x0 * 2:x1 * 2]
+            self.levels[k][y0:y1, x0:x1] = _downsample(src)
+        return True
+
+    def level_for(self, width, height):
+        """回傳不小於目標尺寸的最小層級"""
+        for level in reversed(self.levels):
+            if level.shape[1] >= width and level.shape[0] >= height:
+                return level
+        return self.levels[0]
+
+    def render(self, size, fast=True):
+        """產生指定尺寸的預覽；fast 用雙線性，否則用 LANCZOS 精修"""
+        img = Image.fromarray(self.level_for(*size))
+        if img.size == tuple(size):
+            return img
+        return img.resize(tuple(size), Image.BILINEAR if fast else Image.LANCZOS)
+
+
+def make_proxy(image, max_side=PROXY_MAX_SIDE):
+    """產生最長邊不超過 max_side 的代理影像，原圖夠小時直接回傳原圖"""
+    h, w = image.shape[:2]
+    scale = max_side / max(h, w)
+    if scale >= 1:
+        return image
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
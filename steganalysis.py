@@ -0,0 +1,177 @@
+"""不需原圖的 LSB 盲偵測：卡方攻擊、RS 分析與樣本對分析（SPA），以 NumPy 直方圖與區塊運算計算；
+估計值為嵌入率，即攜帶訊息位元的樣本比例（0~1）"""
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from lsb_engine import check_cancel
+
+# 每個區塊各自估計嵌入率的邊長（像素）
+TILE_SIZE = 256
+# 卡方攻擊沿嵌入順序累加直方圖的區段數
+CHI_SEGMENTS = 32
+# 卡方檢定略過期望次數過少的值對
+CHI_MIN_EXPECTED = 5
+# 前綴的卡方機率高於此值時視為已嵌入
+CHI_THRESHOLD = 0.5
+# RS 分析以水平相鄰 4 個樣本為一組，只翻轉中間兩個
+RS_MASK = np.array([False, True, True, False])
+
+StegoEstimate = namedtuple('StegoEstimate', 'chi_square rs spa')
+# tiles 為 (列數, 行數, 3) 陣列，依序為各區塊的卡方、RS、SPA 估計值
+StegoReport = namedtuple('StegoReport', 'overall tiles tile_size')
+
+_erfc = np.frompyfunc(math.erfc, 1, 1)
+
+
+def _chi2_sf(stat, df):
+    """卡方分布的右尾機率（Wilson–Hilferty 近似，自由度數十以上時誤差可忽略）"""
+    df = np.asarray(df, dtype=np.float64)
+    safe = np.maximum(df, 1)
+    h = 2 / (9 * safe)
+    z = (np.cbrt(stat / safe) - (1 - h)) / np.sqrt(h)
+    p = np.asarray(_erfc(z / math.sqrt(2)), dtype=np.float64) / 2
+    # 有效值對太少時無法判斷
+    return np.where(df >= 1, p, 0.0)
+
+
+def chi_square_pvalue(hist):
+    """Westfeld 卡方攻擊：由 256 階直方圖計算值對 (2k, 2k+1) 已被 LSB 替換均等化的機率，hist 可為 (..., 256)"""
+    pairs = np.asarray(hist, dtype=np.float64).reshape(np.shape(hist)[:-1] + (128, 2))
+    expected = pairs.mean(-1)
+    valid = expected >= CHI_MIN_EXPECTED
+    terms = (pairs[..., 0] - expected) ** 2 / np.where(valid, expected, 1)
+    return _chi2_sf(np.where(valid, terms, 0).sum(-1), valid.sum(-1) - 1)
+
+
+def chi_square_rate(samples, segments=CHI_SEGMENTS):
+    """依嵌入順序（列→行→通道）累加直方圖，回傳機率仍高於門檻的最長前綴比例；
+    依序嵌入時即為嵌入率，分散嵌入時只有接近滿載才偵測得到"""
+    samples = samples.reshape(-1)
+    bounds = np.linspace(0, samples.size, segments + 1).astype(np.int64)
+    hists = np.stack([np.bincount(samples[a:b], minlength=256) for a, b in zip(bounds[:-1], bounds[1:])])
+    # 開頭若是單色背景，前幾段的有效值對太少而機率為 0，因此取最後一個高於門檻的前綴
+    embedded = np.flatnonzero(chi_square_pvalue(np.cumsum(hists, axis=0)) > CHI_THRESHOLD)
+    return float(embedded[-1] + 1) / segments if embedded.size else 0.0
+
+
+def _samples(img):
+    """統一為 (高, 寬, 通道)；同一通道中水平相鄰的樣本沿第 1 軸排列"""
+    img = np.asarray(img)
+    return img[..., None] if img.ndim == 2 else img
+
+
+def _smoothness(g0, g1, g2, g3):
+    return np.abs(g1 - g0) + np.abs(g2 - g1) + np.abs(g3 - g2)
+
+
+def rs_counts(img):
+    """RS 分析的計數：原圖與全部 LSB 翻轉後，各自在 F1 與 F-1 遮罩下的 (R, S) 組數，最後一項為總組數"""
+    img = _samples(img)
+    width = img.shape[1] // 4 * 4
+    # 每組的 4 個樣本各取一個切片，只翻轉中間兩個（遮罩 [0, 1, 1, 0]）
+    g0, g1, g2, g3 = (img[:, i:width:4].astype(np.int16) for i in range(4))
+    counts = []
+    for flip_all in (False, True):
+        if flip_all:
+            g0, g1, g2, g3 = g0 ^ 1, g1 ^ 1, g2 ^ 1, g3 ^ 1
+        smooth = _smoothness(g0, g1, g2, g3)
+        f1, f2 = g1 ^ 1, g2 ^ 1
+        # F1 翻轉 0↔1、2↔3…；F-1 翻轉 -1↔0、1↔2…，即 2x - F1(x)
+        for h1, h2 in ((f1, f2), (2 * g1 - f1, 2 * g2 - f2)):
+            after = _smoothness(g0, h1, h2, g3)
+            counts += [np.count_nonzero(after > smooth), np.count_nonzero(after < smooth)]
+    return np.array(counts + [g0.size], dtype=np.int64)
+
+
+def rs_rate(counts):
+    """Fridrich 的 RS 分析：由 rs_counts（可為多個區塊的總和）解二次方程式估計嵌入率"""
+    r_m, s_m, r_n, s_n, r_m1, s_m1, r_n1, s_n1, total = counts
+    if not total:
+        return 0.0
+    d0, d1 = (r_m - s_m) / total, (r_m1 - s_m1) / total
+    n0, n1 = (r_n - s_n) / total, (r_n1 - s_n1) / total
+    a = 2 * (d1 + d0)
+    b = n0 - n1 - d1 - 3 * d0
+    c = d0 - n0
+    z = _smaller_root(a, b, c)
+    return float(np.clip(z / (z - 0.5), 0, 1)) if z != 0.5 else 1.0
+
+
+def spa_counts(img):
+    """樣本對分析的計數：水平相鄰樣本對 (u, v) 中屬於 X、Y 集合與 u、v 同屬一個 LSB 值對的數量，最後一項為總對數"""
+    img = _samples(img)
+    u, v = img[:, :-1], img[:, 1:]
+    x = np.count_nonzero(np.where(v & 1, u > v, u < v))
+    y = np.count_nonzero(u != v) - x
+    k = np.count_nonzero((u >> 1) == (v >> 1))
+    return np.array([x, y, k, u.size], dtype=np.int64)
+
+
+def spa_rate(counts):
+    """Dumitrescu 等人的樣本對分析：由 spa_counts（可為多個區塊的總和）估計嵌入率"""
+    x, y, k, total = counts
+    if not k:
+        return 0.0
+    return float(np.clip(_smaller_root(k / 2, 2 * x - total, y - x), 0, 1))
+
+
+def _smaller_root(a, b, c):
+    """a·z² + b·z + c = 0 絕對值較小的實根；判別式為負時取頂點"""
+    if abs(a) < 1e-12:
+        return -c / b if b else 0.0
+    disc = b * b - 4 * a * c
+    if disc < 0:
+        return -b / (2 * a)
+    roots = ((-b + math.sqrt(disc)) / (2 * a), (-b - math.sqrt(disc)) / (2 * a))
+    return min(roots, key=abs)
+
+
+def estimate(img):
+    """估計整張圖片的嵌入率，回傳 StegoEstimate"""
+    return StegoEstimate(chi_square_rate(img), rs_rate(rs_counts(img)), spa_rate(spa_counts(img)))
+
+
+def analyze(img, tile_size=TILE_SIZE, progress=None, cancel=None):
+    """逐區塊估計嵌入率，回傳 StegoReport；整張圖片的 RS 與 SPA 由各區塊的計數加總而得，
+    卡方攻擊則須依整張圖片的嵌入順序計算"""
+    height, width = img.shape[:2]
+    rows, cols = -(-height // tile_size), -(-width // tile_size)
+    tiles = np.zeros((rows, cols, 3))
+    rs_total = np.zeros(9, dtype=np.int64)
+    spa_total = np.zeros(4, dtype=np.int64)
+    for r in range(rows):
+        check_cancel(cancel)
+        for c in range(cols):
+            block = img[r * tile_size:(r + 1) * tile_size, c * tile_size:(c + 1) * tile_size]
+            rs, spa = rs_counts(block), spa_counts(block)
+            rs_total += rs
+            spa_total += spa
+            tiles[r, c] = chi_square_rate(block), rs_rate(rs), spa_rate(spa)
+        if progress:
+            progress((r + 1) / rows)
+    overall = StegoEstimate(chi_square_rate(img), rs_rate(rs_total), spa_rate(spa_total))
+    return StegoReport(overall, tiles, tile_size)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    import batch_engine
+
+    parser = argparse.ArgumentParser(description="批次估計目錄中圖片的 LSB 嵌入率（卡方、RS、SPA）")
+    parser.add_argument("root", help="要分析的目錄")
+    parser.add_argument("report", help="CSV 報告檔路徑")
+    parser.add_argument("--tile", type=int, default=TILE_SIZE, help="區塊邊長（像素）")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = 0
+    for result in batch_engine.run_steganalysis(args.root, args.report, args.tile, workers=args.workers):
+        count += 1
+        if not result.ok:
+            print(f"{result.name}: {result.message}")
+    print(f"已分析 {count} 張，{time.perf_counter() - start:.1f} 秒，報告: {args.report}")
@@ -0,0 +1,85 @@
+"""LSB 資料的串流認證加密（AES-GCM）：逐塊加解密，密鑰錯誤時在解密資料前即可判斷"""
+import hashlib
+import hmac
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+
+# 資料格式：nonce(12) | 密鑰檢查碼(8) | 密文 | 驗證標籤(16)
+NONCE_SIZE = 12
+CHECK_SIZE = 8
+TAG_SIZE = 16
+PREFIX_SIZE = NONCE_SIZE + CHECK_SIZE
+OVERHEAD = PREFIX_SIZE + TAG_SIZE
+# 每次加密的區塊大小
+CHUNK_SIZE = 1 << 19
+
+
+class WrongKeyError(ValueError):
+    """密鑰檢查碼不符"""
+
+
+def new_nonce():
+    return get_random_bytes(NONCE_SIZE)
+
+
+def key_check(key, nonce):
+    """由密鑰與 nonce 導出的檢查碼，讀到前置資料即可判斷密鑰是否正確"""
+    return hmac.new(key, b'DWLS key check' + nonce, hashlib.sha256).digest()[:CHECK_SIZE]
+
+
+def encrypted_size(length):
+    """length 位元組明文加密後的大小"""
+    return length + OVERHEAD
+
+
+def encrypt_chunks(data, key, nonce):
+    """逐塊產生 data 的加密結果：前置資料、各區塊密文、驗證標籤"""
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce, mac_len=TAG_SIZE)
+    yield nonce + key_check(key, nonce)
+    view = memoryview(data)
+    for start in range(0, len(view), CHUNK_SIZE):
+        yield cipher.encrypt(view[start:start + CHUNK_SIZE])
+    yield cipher.digest()
+
+
+class StreamDecryptor:
+    """逐塊解密：open() 讀取前置資料並檢查密鑰，update() 解密，finish() 驗證標籤"""
+
+    def __init__(self, key):
+        self.key = key
+        self._cipher = None
+        self._tail = b''
+
+    def open(self, read):
+        """以 read(count) 讀取前置資料，密鑰錯誤時丟出 WrongKeyError；回傳讀取的位元組數"""
+        prefix = read(PREFIX_SIZE)
+        if prefix is None or len(prefix) < PREFIX_SIZE:
+            raise ValueError("加密資料不完整")
+        nonce = prefix[:NONCE_SIZE]
+        if not hmac.compare_digest(prefix[NONCE_SIZE:], key_check(self.key, nonce)):
+            raise WrongKeyError("密鑰錯誤，無法解密 LSB 資料")
+        self._cipher = AES.new(self.key, AES.MODE_GCM, nonce=nonce, mac_len=TAG_SIZE)
+        return PREFIX_SIZE
+
+    def update(self, chunk):
+        """解密一塊資料；尾端可能是驗證標籤的位元組保留到下一塊或 finish()"""
+        data = self._tail + bytes(chunk)
+        n = max(0, len(data) - TAG_SIZE)
+        self._tail = data[n:]
+        return self._cipher.decrypt(data[:n])
+
+    def finish(self):
+        """驗證標籤，資料被竄改或損毀時丟出 ValueError"""
+        try:
+            self._cipher.verify(self._tail)
+        except ValueError:
+            raise ValueError("LSB 資料驗證失敗，內容可能已損毀或遭竄改") from None
+        return b''
+
+
+def decrypt(payload, key):
+    """一次解密 encrypt_chunks 產生的完整資料"""
+    decryptor = StreamDecryptor(key)
+    start = decryptor.open(lambda count: payload[:count])
+    return decryptor.update(payload[start:]) + decryptor.finish()
@@ -0,0 +1,95 @@
+"""LSB 容器格式的行為測試：寫入影像的位置與位元一旦改變，舊圖片就讀不出來"""
+import base64
+
+import numpy as np
+import pytest
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+import lsb_engine as le
+import stream_cipher
+import watermark_core as core
+
+KEY = bytes(range(16))
+AES_KEY = "0123456789abcdef"
+TEXT = "隱藏訊息 hidden message " * 8
+
+
+@pytest.fixture
+def carrier():
+    return np.random.default_rng(0).integers(0, 256, (120, 160, 3), dtype=np.uint8)
+
+
+def test_scatter_positions_fixed_vector():
+    # 分散嵌入的位置只由密鑰與樣本數決定，改動演算法會讓既有圖片無法讀取
+    le._scatter_cache.clear()
+    positions = le.scatter_positions(KEY, 1_000_000, 8)
+    assert positions.tolist() == [102876, 164546, 772457, 584662, 45301, 500692, 923268, 216899]
+
+
+def test_scatter_positions_prefix_consistent():
+    le._scatter_cache.clear()
+    short = le.scatter_positions(KEY, 100_000, 50).copy()
+    long = le.scatter_positions(KEY, 100_000, 5000)
+    le._scatter_cache.clear()
+    assert np.array_equal(long[:50], short)
+    assert np.array_equal(le.scatter_positions(KEY, 100_000, 5000), long)
+    assert np.unique(long).size == long.size
+    assert long.min() >= le.HEADER_BITS and long.max() < 100_000
+
+
+def test_permutation_is_bijection():
+    positions = le._permutation_prefix(b"\x00" * 32, 1000, 0, 1000)
+    assert np.array_equal(np.sort(positions), np.arange(1000))
+
+
+@pytest.mark.parametrize("depth", [1, 2, 3, 4])
+@pytest.mark.parametrize("scatter", [False, True])
+@pytest.mark.parametrize("compress", [False, True])
+def test_text_round_trip(carrier, depth, scatter, compress):
+    out, used, _ = core.embed_lsb_text(carrier, TEXT, AES_KEY, compress, depth, scatter)
+    # 只改動每個樣本最低 depth 位元
+    assert np.all(out >> depth == carrier >> depth)
+    header, _ = le.extract_container(out, scatter_key=core.check_aes_key(AES_KEY))
+    assert header.depth == depth and header.length == used
+    assert bool(header.flags & le.FLAG_SCATTER) == scatter
+    assert (header.codec != le.CODEC_NONE) == compress
+    assert core.extract_lsb_text(out, AES_KEY) == TEXT
+
+
+@pytest.mark.parametrize("depth", [1, 3])
+def test_image_round_trip(carrier, depth):
+    wm = np.random.default_rng(1).integers(0, 256, (20, 30, 3), dtype=np.uint8)
+    out, _, _ = core.embed_lsb_image(carrier, wm, True, depth, AES_KEY)
+    _, extracted = core.extract_lsb_image(out, key=AES_KEY)
+    assert np.array_equal(extracted, wm)
+
+
+def test_wrong_key(carrier):
+    out, _, _ = core.embed_lsb_text(carrier, TEXT, AES_KEY)
+    with pytest.raises(stream_cipher.WrongKeyError):
+        core.extract_lsb_text(out, "fedcba9876543210")
+
+
+def test_scatter_requires_key(carrier):
+    out, _, _ = core.embed_lsb_text(carrier, TEXT, AES_KEY, scatter=True)
+    with pytest.raises(ValueError):
+        le.extract_payload(out)
+
+
+def test_crc_mismatch(carrier):
+    out = le.embed_container(carrier, b"plain payload bytes")
+    assert le.extract_payload(out)[1] == b"plain payload bytes"
+    out.reshape(-1)[le.HEADER_BITS + 5] ^= 1
+    with pytest.raises(ValueError, match="CRC"):
+        le.extract_payload(out)
+
+
+def test_legacy_sentinel(carrier):
+    # 舊版：base64(AES-ECB(文字)) 後接終止標記，沒有標頭
+    cipher = AES.new(AES_KEY.encode("utf-8"), AES.MODE_ECB)
+    msg = base64.b64encode(cipher.encrypt(pad(TEXT.encode("utf-8"), AES.block_size)))
+    out = le.embed_payload(carrier, msg)
+    header, payload = le.extract_payload(out)
+    assert header is None and payload == msg
+    assert core.extract_lsb_text(out, AES_KEY) == TEXT
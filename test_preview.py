@@ -0,0 +1,69 @@
+"""代理預覽的幾何一致性：同一組參數畫在原圖與代理影像上，浮水印位置換算回原圖後誤差不超過一個代理像素"""
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image, ImageFont
+
+import watermark_core as core
+from preview import make_proxy
+
+HERE = Path(__file__).parent
+FULL_SIZE = (4000, 3000)
+
+
+@pytest.fixture(scope="module")
+def font_path(tmp_path_factory):
+    """預設字型不會依大小縮放，需要 TrueType 字型；沒有內附字型時使用 Pillow 內建的字型檔"""
+    bundled = HERE / "NotoSansCJK-Regular.ttf"
+    if bundled.exists():
+        return str(bundled)
+    font = ImageFont.load_default(size=12)
+    if not hasattr(font, "font_bytes"):
+        pytest.skip("沒有可縮放的 TrueType 字型")
+    path = tmp_path_factory.mktemp("font") / "default.ttf"
+    path.write_bytes(font.font_bytes)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def watermark():
+    return Image.open(HERE / "A.png").convert("RGBA")
+
+
+def changed_bbox(old, new):
+    """比較兩張同尺寸影像，回傳變動範圍 (x0, y0, x1, y1)，沒有變動時回傳 None"""
+    diff = (old != new).any(axis=2)
+    rows = np.flatnonzero(diff.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(diff.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+
+@pytest.mark.parametrize("op", ["text", "image", "all"])
+def test_proxy_matches_full_resolution(op, font_path, watermark):
+    params = core.WatermarkParams(text="Proxy 預覽", font_path=font_path, font_size=120,
+                                  alpha=255, x=700, y=500, color=(255, 0, 0))
+    wm = watermark if op in ("image", "all") else None
+    base = np.full((FULL_SIZE[1], FULL_SIZE[0], 3), 128, np.uint8)
+    proxy = make_proxy(base)
+    assert proxy.shape[:2] != base.shape[:2]
+
+    full, full_box = core.render_watermark(base, op, params, wm)
+    small, proxy_box = core.render_watermark(proxy, op, params, wm, full_size=FULL_SIZE)
+
+    # 合成器回報的範圍涵蓋所有實際變動的像素
+    for image, result, box in ((base, full, full_box), (proxy, small, proxy_box)):
+        changed = changed_bbox(image, result)
+        assert changed is not None
+        assert all(b <= c for b, c in zip(box[:2], changed[:2]))
+        assert all(b >= c for b, c in zip(box[2:], changed[2:]))
+
+    sx = base.shape[1] / proxy.shape[1]
+    sy = base.shape[0] / proxy.shape[0]
+    full_changed = changed_bbox(base, full)
+    proxy_changed = changed_bbox(proxy, small)
+    mapped = (proxy_changed[0] * sx, proxy_changed[1] * sy, proxy_changed[2] * sx, proxy_changed[3] * sy)
+    for a, b, step in zip(full_changed, mapped, (sx, sy, sx, sy)):
+        assert abs(a - b) <= step
@@ -0,0 +1,470 @@
+"""大型載體的分塊處理：以列條帶讀取、修改並寫出，記憶體用量只與條帶大小有關"""
+import logging
+import os
+import shutil
+import struct
+import sys
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import compositor
+from lsb_engine import (CODEC_NONE, LsbStreamReader, SampleWriter, check_cancel, container_samples_count, container_segments,
+                        read_container, scan_until_sentinel)
+
+logger = logging.getLogger('watermark_app.tiled')
+
+# 超過此像素數的圖片改以分塊模式處理
+LARGE_IMAGE_PIXELS = 100_000_000
+# 每個條帶約佔用的記憶體
+STRIP_BYTES = 16 << 20
+
+# 可直接分塊讀取的未壓縮 rawmode 與每像素位元組數
+_RAW_PIXEL_BYTES = {"RGB": 3, "BGR": 3, "RGBX": 4, "BGRX": 4, "L": 1}
+# 可原地改寫的 rawmode 中，cv2 的 B、G、R 通道各自所在的位元組位置
+_BGR_ORDER = {"RGB": [2, 1, 0], "RGBX": [2, 1, 0], "BGR": [0, 1, 2], "BGRX": [0, 1, 2]}
+# Linux 的 reflink ioctl
+FICLONE = 0x40049409
+
+# 差異分析的放大倍數（與原本的「差異 x20」一致，超過 255 時飽和而不溢位）
+DIFF_GAIN = 20
+# 每個值的各位元是否為 1，用來由 XOR 直方圖換算各位元平面的變更數
+_BIT_TABLE = (np.arange(256)[:, None] >> np.arange(8)) & 1
+
+# original、modified、enhanced 為 RGB 縮圖；density 為各區塊的變更樣本比例；
+# plane_counts 為 (R/G/B, 位元 0~7) 的變更樣本數，channel_counts 為各通道的變更樣本數
+DiffReport = namedtuple('DiffReport', 'original modified enhanced density block plane_counts channel_counts total')
+
+
+def _open_image(path):
+    """只讀取檔頭；掃描檔動輒數十億像素，超過 PIL 的解壓縮炸彈上限屬正常情況"""
+    limit = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        return Image.open(path)
+    finally:
+        Image.MAX_IMAGE_PIXELS = limit
+
+
+def _raw_strips(im):
+    """取得涵蓋整列的未壓縮資料區塊 (起始列, 結束列, 位移, rawmode, 每列位元組, 方向)，無法分塊讀取時回傳 None"""
+    # 含 alpha 的圖片 cv2 會預先乘上透明度，為了與整張處理的結果一致改走整張解碼
+    if im.mode not in ("RGB", "L"):
+        return None
+    strips = []
+    for name, (x0, y0, x1, y1), offset, args in im.tile:
+        if isinstance(args, str):
+            args = (args,)
+        rawmode = args[0]
+        if name != "raw" or x0 != 0 or x1 != im.width or rawmode not in _RAW_PIXEL_BYTES:
+            return None
+        stride = args[1] if len(args) > 1 and args[1] else im.width * _RAW_PIXEL_BYTES[rawmode]
+        orientation = args[2] if len(args) > 2 else 1
+        strips.append((y0, y1, offset, rawmode, stride, orientation))
+
+    # 各區塊須依序銜接並涵蓋整張圖片
+    strips.sort()
+    row = 0
+    for y0, y1, *_ in strips:
+        if y0 != row:
+            return None
+        row = y1
+    return strips if row == im.height else None
+
+
+def is_large(path):
+    """依檔頭判斷是否需要分塊處理；PIL 無法辨識的檔案交給 cv2 整張處理"""
+    try:
+        with _open_image(path) as im:
+            return im.width * im.height > LARGE_IMAGE_PIXELS
+    except Exception:
+        return False
+
+
+class StripReader:
+    """以列條帶讀取載體並轉為 RGB 陣列；未壓縮的 TIFF/BMP/PPM/PGM 只讀取檔案中對應的位元組，
+    其他格式退回以 cv2 整張解碼"""
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        with _open_image(self.path) as im:
+            self.width, self.height = im.size
+            self.mode = im.mode
+            self._tiles = _raw_strips(im)
+        self.streaming = self._tiles is not None
+        # 與 cv2 讀入的 BGR 陣列相同的形狀，size 可直接用於 lsb_engine.capacity_bytes
+        self.shape = (self.height, self.width, 3)
+        self.size = self.height * self.width * 3
+
+    def rows_per_strip(self):
+        return max(1, STRIP_BYTES // (self.width * 3))
+
+    def strips(self, rows=None):
+        """依序產生 (起始列, 結束列, RGB 陣列)"""
+        rows = rows or self.rows_per_strip()
+        if not self.streaming:
+            logger.warning(f'{self.path} 不是未壓縮格式，改為整張載入')
+            img = cv2.imread(self.path)
+            if img is None:
+                raise ValueError(f"無法載入圖片 {self.path}")
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            for r0 in range(0, self.height, rows):
+                yield r0, min(self.height, r0 + rows), img[r0:r0 + rows]
+            return
+
+        with open(self.path, "rb") as f:
+            for r0 in range(0, self.height, rows):
+                r1 = min(self.height, r0 + rows)
+                yield r0, r1, self._read_rows(f, r0, r1)
+
+    def _read_rows(self, f, r0, r1):
+        parts = []
+        for y0, y1, offset, rawmode, stride, orientation in self._tiles:
+            a, b = max(r0, y0), min(r1, y1)
+            if a >= b:
+                continue
+            # 由下往上儲存的區塊（BMP）從區塊尾端倒數
+            start = offset + ((y1 - b) if orientation < 0 else (a - y0)) * stride
+            f.seek(start)
+            data = bytearray((b - a) * stride)
+            if f.readinto(data) < len(data):
+                raise ValueError(f"圖片檔案不完整 {self.path}")
+            # 由上往下、無填充的 RGB 資料直接當作陣列使用，省去 PIL 的轉換與複製
+            if rawmode == "RGB" and orientation == 1 and stride == self.width * 3:
+                parts.append(np.frombuffer(data, np.uint8).reshape(b - a, self.width, 3))
+                continue
+            part = Image.frombytes(self.mode, (self.width, b - a), bytes(data), "raw", rawmode, stride, orientation)
+            parts.append(np.array(part.convert("RGB")))
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+class TiffStripWriter:
+    """依序寫入列條帶的未壓縮 RGB TIFF；資料超過 4 GB 時改寫 BigTIFF"""
+
+    def __init__(self, path, width, height, rows_per_strip=None):
+        self.width, self.height = width, height
+        self.row_bytes = width * 3
+        self.rows_per_strip = rows_per_strip or max(1, (1 << 20) // self.row_bytes)
+        # 預留 IFD 與條帶位移表的空間
+        self.bigtiff = height * self.row_bytes + (16 << 20) > 0xFFFFFFFF
+        self.rows = 0
+        self.path = path
+        self._file = open(path, "wb")
+        self._file.write(self._header(0))
+        self._data_start = self._file.tell()
+
+    def _header(self, ifd_offset):
+        if self.bigtiff:
+            return b"II" + struct.pack("<HHHQ", 43, 8, 0, ifd_offset)
+        return b"II" + struct.pack("<HI", 42, ifd_offset)
+
+    def write(self, strip):
+        """寫入 (列數, 寬, 3) 的 RGB 條帶"""
+        if strip.shape[1:] != (self.width, 3):
+            raise ValueError(f"條帶尺寸不符: {strip.shape}")
+        self._file.write(np.ascontiguousarray(strip, dtype=np.uint8).data)
+        self.rows += strip.shape[0]
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            if self.rows != self.height:
+                raise ValueError(f"寫入列數 {self.rows} 與圖片高度 {self.height} 不符")
+            self._write_ifd()
+        finally:
+            self._file.close()
+
+    def _write_ifd(self):
+        f = self._file
+        rps = self.rows_per_strip
+        count = (self.height + rps - 1) // rps
+        offsets = [self._data_start + i * rps * self.row_bytes for i in range(count)]
+        counts = [min(rps, self.height - i * rps) * self.row_bytes for i in range(count)]
+        long_type = 16 if self.bigtiff else 4  # LONG8 / LONG
+        entries = [(256, long_type, [self.width]), (257, long_type, [self.height]), (258, 3, [8, 8, 8]),
+                   (259, 3, [1]), (262, 3, [2]), (273, long_type, offsets), (277, 3, [3]),
+                   (278, long_type, [rps]), (279, long_type, counts), (284, 3, [1])]
+
+        # 放不進欄位的值先寫在 IFD 之前（位移需為偶數）
+        inline = 8 if self.bigtiff else 4
+        pointer = "<Q" if self.bigtiff else "<I"
+        fields = []
+        for tag, kind, values in entries:
+            data = struct.pack(f"<{len(values)}{'H' if kind == 3 else 'I' if kind == 4 else 'Q'}", *values)
+            if len(data) > inline:
+                if f.tell() % 2:
+                    f.write(b"\0")
+                pos = f.tell()
+                f.write(data)
+                data = struct.pack(pointer, pos)
+            fields.append((tag, kind, len(values), data.ljust(inline, b"\0")))
+
+        if f.tell() % 2:
+            f.write(b"\0")
+        ifd = f.tell()
+        f.write(struct.pack("<Q" if self.bigtiff else "<H", len(fields)))
+        for tag, kind, n, data in fields:
+            f.write(struct.pack("<HHQ" if self.bigtiff else "<HHI", tag, kind, n) + data)
+        f.write(struct.pack(pointer, 0))
+        f.seek(0)
+        f.write(self._header(ifd))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # 中途失敗或取消時不留下不完整的檔案
+            self._file.close()
+            os.remove(self.path)
+
+
+def _lsb_bits(strip):
+    """依 cv2 的 BGR 通道順序取出條帶的 LSB 位元，與整張處理時的位元順序一致"""
+    return (strip[..., ::-1] & 1).reshape(-1)
+
+
+class StripLsbReader(LsbStreamReader):
+    """依序讀出條帶的 LSB 位元組，需要時才讀取下一個條帶"""
+
+    def __init__(self, reader):
+        # 依 cv2 的 BGR 通道順序攤平，與整張處理時的樣本順序一致
+        super().__init__(strip[..., ::-1].reshape(-1) for r0, r1, strip in reader.strips())
+
+
+def extract_payload_file(path, progress=None, cancel=None, decoder=None, scatter_key=None):
+    """分塊版的 lsb_engine.extract_payload：回傳 (標頭, 資料)，舊版標頭為 None，找不到資料時回傳 None"""
+    reader = StripReader(path)
+    found = read_container(StripLsbReader(reader), reader, progress, cancel, decoder, scatter_key)
+    if found is not None:
+        return found
+
+    # 舊版格式沒有長度資訊，逐條帶尋找終止標記
+    chunks = ((r0, r1, _lsb_bits(strip)) for r0, r1, strip in reader.strips())
+    payload = scan_until_sentinel(chunks, reader.height, progress=progress, cancel=cancel)
+    if payload is None:
+        return None
+    return None, payload
+
+
+def embed_container_file(src, dst, payload, flags=0, codec=CODEC_NONE, depth=1, progress=None, cancel=None):
+    """把含標頭的資料逐條帶嵌入 src，寫出未壓縮 TIFF 到 dst，回傳使用的樣本數；
+    payload 為 StreamPayload 時邊產生邊寫入"""
+    reader = StripReader(src)
+    total = container_samples_count(len(payload), depth)
+    if total > reader.size:
+        raise ValueError(f"資料過大 ({total}/{reader.size} 個樣本)")
+
+    samples = SampleWriter(container_segments(payload, flags, codec, depth))
+    with TiffStripWriter(dst, reader.width, reader.height) as writer:
+        for r0, r1, strip in reader.strips():
+            check_cancel(cancel)
+            if samples.written < total:
+                # 依 cv2 的 BGR 順序寫入，與整張處理時的樣本順序一致
+                bgr = np.ascontiguousarray(strip[..., ::-1])
+                samples.write(bgr.reshape(-1))
+                strip = bgr[..., ::-1]
+            writer.write(strip)
+            if progress:
+                progress(r1 / reader.height)
+    return total
+
+
+def watermark_file(src, dst, layer, progress=None, cancel=None):
+    """逐條帶套用可見浮水印圖層（元素座標為原圖座標），寫出未壓縮 TIFF 到 dst"""
+    reader = StripReader(src)
+    with TiffStripWriter(dst, reader.width, reader.height) as writer:
+        for r0, r1, strip in reader.strips():
+            check_cancel(cancel)
+            compositor.apply_layer(strip, compositor.offset_layer(layer, 0, -r0))
+            writer.write(strip)
+            if progress:
+                progress(r1 / reader.height)
+
+
+def inplace_layout(path):
+    """回傳可原地改寫的 (寬, 高, 資料區塊)；壓縮、灰階或含 alpha 的圖片回傳 None"""
+    try:
+        with _open_image(path) as im:
+            width, height = im.size
+            tiles = _raw_strips(im)
+    except Exception:
+        return None
+    if tiles is None or any(tile[3] not in _BGR_ORDER for tile in tiles):
+        return None
+    return width, height, tiles
+
+
+def _clone_file(src, dst):
+    """複製檔案；支援 reflink 的檔案系統（Btrfs、XFS）上只建立寫入時複製的參照，不實際複製資料"""
+    try:
+        import fcntl
+        with open(src, "rb") as fin, open(dst, "wb") as fout:
+            fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+        return
+    except (ImportError, OSError):
+        pass
+    shutil.copyfile(src, dst)
+
+
+def embed_container_inplace(path, payload, flags=0, codec=CODEC_NONE, depth=1, output=None):
+    """以 np.memmap 只改寫資料涵蓋的列的 LSB，不重新編碼整張圖片；
+    指定 output 時先複製（可行時為寫入時複製）到 output 再改寫副本。回傳使用的樣本數"""
+    layout = inplace_layout(path)
+    if layout is None:
+        raise ValueError("此圖片不是可原地改寫的未壓縮 RGB 格式")
+    width, height, tiles = layout
+    total = container_samples_count(len(payload), depth)
+    if total > width * height * 3:
+        raise ValueError(f"資料過大 ({total}/{width * height * 3} 個樣本)")
+
+    if output is not None and not (os.path.exists(output) and os.path.samefile(path, output)):
+        _clone_file(path, output)
+        path = output
+
+    rows_needed = -(-total // (width * 3))
+    samples = SampleWriter(container_segments(payload, flags, codec, depth))
+    for y0, y1, offset, rawmode, stride, orientation in tiles:
+        if y0 >= rows_needed:
+            break
+        b = min(y1, rows_needed)
+        # 只映射資料涵蓋的列；由下往上儲存的區塊（BMP）從區塊尾端倒數
+        start = offset + ((y1 - b) * stride if orientation < 0 else 0)
+        mm = np.memmap(path, dtype=np.uint8, mode="r+", offset=start, shape=(b - y0, stride))
+        rows = mm[::-1] if orientation < 0 else mm
+        pixels = rows[:, :width * _RAW_PIXEL_BYTES[rawmode]].reshape(b - y0, width, -1)
+
+        # 依 cv2 的 BGR 順序排列後寫入，與整張處理時的位元順序一致
+        order = _BGR_ORDER[rawmode]
+        block = np.ascontiguousarray(pixels[..., order])
+        samples.write(block.reshape(-1))
+        pixels[..., order] = block
+        mm.flush()
+        del mm, rows, pixels
+    return total
+
+
+def load_preview(reader, max_side, progress=None, cancel=None):
+    """逐條帶以整數倍區塊平均縮小，回傳最長邊約不超過 max_side 的 RGB 預覽"""
+    k = max(1, -(-max(reader.width, reader.height) // max_side))
+    w = reader.width // k
+    rows = max(k, reader.rows_per_strip() // k * k)
+    out = []
+    for r0, r1, strip in reader.strips(rows):
+        check_cancel(cancel)
+        if progress:
+            progress(r1 / reader.height)
+        n = (r1 - r0) // k
+        if n == 0:
+            continue
+        block = strip[:n * k, :w * k].reshape(n, k, w, k, 3)
+        out.append(block.mean(axis=(1, 3), dtype=np.float32).round().astype(np.uint8))
+    return np.concatenate(out)
+
+
+def _shrink(strip, k, w, n):
+    """以 k×k 區塊面積平均把條帶縮成 n 列 w 行"""
+    return cv2.resize(strip[:n * k, :w * k], (w, n), interpolation=cv2.INTER_AREA)
+
+
+def lsb_difference(reader_a, reader_b, max_side, progress=None, cancel=None):
+    """逐條帶比較兩張相同尺寸的圖片，回傳 DiffReport；縮圖與變更密度皆以整數倍區塊面積平均縮小，
+    記憶體用量只與條帶大小有關"""
+    if (reader_a.width, reader_a.height) != (reader_b.width, reader_b.height):
+        raise ValueError("兩張圖片尺寸不同，無法比較")
+    # 極細長的圖片也至少保留一列一行縮圖
+    k = max(1, min(-(-max(reader_a.width, reader_a.height) // max_side), reader_a.width, reader_a.height))
+    w = reader_a.width // k
+    rows = max(k, reader_a.rows_per_strip() // k * k)
+    hist = np.zeros((3, 256), dtype=np.int64)
+    small = ([], [], [], [])
+    for (r0, r1, a), (_, _, b) in zip(reader_a.strips(rows), reader_b.strips(rows)):
+        check_cancel(cancel)
+        if progress:
+            progress(r1 / reader_a.height)
+        xor = cv2.bitwise_xor(a, b)
+        # 通常只有資料所在的區域有變更，沒有變更的條帶略過直方圖與差異縮圖
+        unchanged = cv2.countNonZero(xor.reshape(xor.shape[0], -1)) == 0
+        if not unchanged:
+            for c in range(3):
+                hist[c] += cv2.calcHist([xor], [c], None, [256], [0, 256]).reshape(-1).astype(np.int64)
+
+        n = (r1 - r0) // k
+        if n == 0:
+            continue
+        small[0].append(_shrink(a, k, w, n))
+        small[1].append(_shrink(b, k, w, n))
+        if unchanged:
+            small[2].append(np.zeros((n, w, 3), dtype=np.uint8))
+            small[3].append(np.zeros((n, w, 3), dtype=np.uint8))
+        else:
+            # 先放大差異（飽和運算）並標記變更的樣本，再以面積平均縮小，不產生任何全尺寸的 PIL 影像
+            small[2].append(_shrink(cv2.convertScaleAbs(cv2.absdiff(a, b), alpha=DIFF_GAIN), k, w, n))
+            small[3].append(_shrink(cv2.threshold(xor, 0, 255, cv2.THRESH_BINARY)[1], k, w, n))
+
+    original, modified, enhanced, changed = (np.concatenate(out) for out in small)
+    channel_counts = hist[:, 1:].sum(axis=1)
+    return DiffReport(original, modified, enhanced, changed.mean(axis=2) / 255, k, hist @ _BIT_TABLE,
+                      channel_counts, reader_a.width * reader_a.height * 3)
+
+
+def peak_rss_mb():
+    """目前程序的峰值 RSS（MB），不支援的平台回傳 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+
+def _bench(width, height, workdir):
+    """產生大型測試 TIFF，量測分塊嵌入、讀取與浮水印合成的時間與峰值 RSS"""
+    import watermark_core as core
+
+    src = os.path.join(workdir, "tiled_bench_src.tif")
+    dst = os.path.join(workdir, "tiled_bench_out.tif")
+    rng = np.random.default_rng(0)
+    with TiffStripWriter(src, width, height) as writer:
+        rows = max(1, STRIP_BYTES // (width * 3))
+        for r0 in range(0, height, rows):
+            writer.write(rng.integers(0, 256, (min(rows, height - r0), width, 3), dtype=np.uint8))
+    print(f"載體: {width} x {height}，解碼後 {width * height * 3 / (1 << 20):.0f} MB")
+
+    payload = rng.integers(0, 256, 1 << 20, dtype=np.uint8).tobytes()
+    t = time.perf_counter()
+    embed_container_file(src, dst, payload)
+    print(f"分塊嵌入 1 MB: {time.perf_counter() - t:.2f} s")
+
+    t = time.perf_counter()
+    header, extracted = extract_payload_file(dst)
+    assert extracted == payload
+    print(f"分塊讀取: {time.perf_counter() - t:.2f} s")
+
+    params = core.WatermarkParams(text="Archive", font_size=max(36, width // 40), alpha=160, x=100, y=100)
+    layer = core.all_layer(params, (width, height))
+    t = time.perf_counter()
+    watermark_file(src, dst, layer)
+    print(f"分塊浮水印: {time.perf_counter() - t:.2f} s")
+
+    rss = peak_rss_mb()
+    print(f"峰值 RSS: {rss:.0f} MB" if rss is not None else "峰值 RSS: 此平台不支援")
+    for path in (src, dst):
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="分塊處理效能測試")
+    parser.add_argument("--width", type=int, default=20000)
+    parser.add_argument("--height", type=int, default=15000)
+    parser.add_argument("--dir", default=".")
+    args = parser.parse_args()
+    _bench(args.width, args.height, args.dir)
@@ -0,0 +1,487 @@
+"""浮水印與 LSB 隱寫的核心運算（不依賴 Tk，可在背景程序中使用）"""
+import base64
+import logging
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import cv2
+import numpy as np
+import qrcode
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import unpad
+from PIL import Image, ImageFont
+
+import asset_cache
+import compositor
+import stream_cipher
+from lsb_engine import (CODEC_NONE, FLAG_AEAD, FLAG_BINARY, FLAG_ENCRYPTED, FLAG_IMAGE, HEADER_BITS, StreamPayload,
+                        capacity_bits, capacity_bytes, compress_payload, decompress_payload, embed_container,
+                        extract_payload)
+
+logger = logging.getLogger('watermark_app.core')
+
+
+@dataclass
+class WatermarkParams:
+    """可見浮水印參數"""
+    text: str = ""
+    font_path: str = ""
+    font_size: int = 36
+    alpha: int = 128
+    x: int = 50
+    y: int = 50
+    color: tuple = (0, 0, 0)
+    add_qrcode: bool = False  # 批次模式是否加入 QR code
+    qr_error_correction: str = "M"
+
+
+def _default_log(status, details=""):
+    logger.info(f'{status}: {details}')
+
+
+def load_font(font_path, size, log=None):
+    """載入字型（經快取），失敗時退回預設字型"""
+    log = log or _default_log
+    try:
+        if font_path and Path(font_path).exists():
+            return asset_cache.get_font(font_path, size)
+        return ImageFont.load_default()
+    except Exception as e:
+        log("警告", f"字型載入失敗: {str(e)}")
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=256)
+def _alpha_scale_lut(alpha):
+    return tuple(int(i * (alpha / 255)) for i in range(256))
+
+
+def scale_alpha(img, alpha):
+    """依 alpha/255 比例調整 RGBA 圖片的透明度（256 項查表）"""
+    if alpha < 255:
+        img.putalpha(img.getchannel("A").point(_alpha_scale_lut(alpha)))
+    return img
+
+
+def clamp_alpha(img, alpha):
+    """將 RGBA 圖片的透明度上限設為 alpha，完全透明的像素清為 0"""
+    arr = np.array(img.convert("RGBA"))
+    transparent = arr[..., 3] == 0
+    arr[..., 3] = np.minimum(arr[..., 3], alpha)
+    arr[transparent] = 0
+    return Image.fromarray(arr, "RGBA")
+
+
+def _watermark_size(wm):
+    """浮水印原始尺寸；wm 可為檔案路徑（經快取）或 PIL 圖片"""
+    if isinstance(wm, (str, os.PathLike)):
+        return asset_cache.load_watermark(wm).size
+    return wm.size
+
+
+def watermark_sprite(wm, size, alpha, adjust=scale_alpha):
+    """取得縮放並調整透明度後的浮水印；wm 為路徑時使用 LRU 快取"""
+    size = tuple(size)
+    if isinstance(wm, (str, os.PathLike)):
+        return asset_cache.watermark_sprite(wm, size, alpha, adjust)
+    wm = wm.convert("RGBA")
+    wm = wm.copy() if wm.size == size else wm.resize(size, Image.LANCZOS)
+    return adjust(wm, alpha)
+
+
+QR_ERROR_CORRECTION = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+
+
+def qrcode_matrix(text, error_correction="M"):
+    """取得含留白邊界的 QR code 模組矩陣（True 為黑色模組），相同內容只編碼一次"""
+    def build():
+        qr = qrcode.QRCode(error_correction=QR_ERROR_CORRECTION[error_correction], border=4)
+        qr.add_data(text)
+        qr.make(fit=True)
+        return np.array(qr.get_matrix(), dtype=bool)
+
+    return asset_cache.qr_matrix_cache.get_or_create((text, error_correction), build)
+
+
+def qrcode_sprite(text, size, alpha, error_correction="M"):
+    """產生 size x size 的 RGBA QR code，模組以整數倍最近鄰放大，再置中補白到指定大小"""
+    def build():
+        matrix = qrcode_matrix(text, error_correction)
+        n = matrix.shape[0]
+        k = size // n
+        if k >= 1:
+            modules = np.repeat(np.repeat(matrix, k, axis=0), k, axis=1)
+            gray = np.full((size, size), 255, dtype=np.uint8)
+            off = (size - n * k) // 2
+            gray[off:off + n * k, off:off + n * k] = np.where(modules, 0, 255)
+        else:
+            # 目標尺寸小於模組數時無法整數放大，直接最近鄰縮小
+            small = Image.fromarray(np.where(matrix, 0, 255).astype(np.uint8))
+            gray = np.array(small.resize((size, size), Image.NEAREST))
+        rgba = np.dstack([gray, gray, gray, np.full_like(gray, 255)])
+        return scale_alpha(Image.fromarray(rgba, "RGBA"), alpha)
+
+    key = (text, size, alpha, error_correction)
+    return asset_cache.qr_sprite_cache.get_or_create(key, build)
+
+
+def _proxy_scale(image, full_size):
+    """代理預覽時 image 相對於原圖的縮放比例與原圖尺寸 (寬, 高)"""
+    h, w = image.shape[:2]
+    if full_size is None or tuple(full_size) == (w, h):
+        return 1.0, (w, h)
+    return w / full_size[0], tuple(full_size)
+
+
+def _scaled(value, scale, minimum=0):
+    """把原圖座標或尺寸換算到代理影像上"""
+    if scale == 1.0:
+        return value
+    return max(minimum, int(round(value * scale)))
+
+
+def _scaled_box(pos, size, scale):
+    return (_scaled(pos[0], scale), _scaled(pos[1], scale)), (_scaled(size[0], scale, 1), _scaled(size[1], scale, 1))
+
+
+# 以下圖層與套用函式的參數一律以原圖座標表示；base_size 為原圖尺寸 (寬, 高)，
+# scale 為實際繪製影像相對於原圖的比例（代理預覽時小於 1），位置與大小會依比例換算
+
+
+def _text_element(xy, text, font, fill, scale):
+    """xy 與 font 為原圖尺度；代理預覽時以原圖字級繪製後縮小，使文字位置與寬度與原圖成比例"""
+    if scale == 1.0:
+        return compositor.text_element(xy, text, font, fill)
+    return compositor.scaled_text_element(xy, text, font, fill, scale)
+
+
+def text_layer(params, base_size, wm=None, log=None, scale=1.0):
+    """文字浮水印圖層"""
+    font = load_font(params.font_path, params.font_size, log)
+    fill = tuple(params.color) + (params.alpha,)
+    text = _text_element((params.x, params.y), params.text, font, fill, scale)
+    return compositor.Layer([text], False, (255, 255, 255, 0))
+
+
+def qrcode_layer(params, base_size, wm=None, log=None, scale=1.0):
+    """右下角的 QR code 浮水印圖層"""
+    base_w, base_h = base_size
+    qr_size = params.font_size * 3
+    qr_pos = (base_w - qr_size - 20, base_h - qr_size - 20)
+    qr_pos, (qr_size, _) = _scaled_box(qr_pos, (qr_size, qr_size), scale)
+    qr = qrcode_sprite(params.text, qr_size, params.alpha, params.qr_error_correction)
+    return compositor.Layer([compositor.sprite_element(qr, qr_pos)], True, None)
+
+
+def image_layer(params, base_size, wm, log=None, scale=1.0):
+    """(x, y) 的圖片浮水印圖層，必要時依主圖尺寸縮放"""
+    log = log or _default_log
+    x, y = params.x, params.y
+
+    base_w, base_h = base_size
+    wm_w, wm_h = size = _watermark_size(wm)
+
+    # 根據主圖尺寸智能調整浮水印大小
+    if x + wm_w > base_w or y + wm_h > base_h:
+        max_w = base_w - x
+        max_h = base_h - y
+
+        # 如果浮水印太大，限制最大尺寸為主圖的 1/3
+        max_w = min(max_w, base_w / 3)
+        max_h = min(max_h, base_h / 3)
+
+        # 保持縱橫比縮放，且不小於原始尺寸的 10%
+        wm_scale = min(max_w / wm_w, max_h / wm_h, 1.0)
+        wm_scale = max(wm_scale, 0.1)
+
+        size = (int(wm_w * wm_scale), int(wm_h * wm_scale))
+        log("成功", f"縮放比例: {wm_scale:.2f}")
+
+    pos, size = _scaled_box((x, y), size, scale)
+    sprite = watermark_sprite(wm, size, params.alpha)
+    return compositor.Layer([compositor.sprite_element(sprite, pos)], True, None)
+
+
+def all_layer(params, base_size, wm=None, log=None, scale=1.0):
+    """文字、圖片與 QR code 浮水印合成一個圖層"""
+    log = log or _default_log
+    fs, a, x, y = params.font_size, params.alpha, params.x, params.y
+    text = params.text.strip()
+
+    base_w, base_h = base_size
+    elements = []
+    font = load_font(params.font_path, fs, log)
+
+    # 套用文字浮水印
+    if text:
+        elements.append(_text_element((x, y), text, font, tuple(params.color) + (a,), scale))
+        log("成功", "已套用文字浮水印")
+
+    # 套用圖片浮水印
+    if wm is not None:
+        try:
+            # 限制浮水印大小不超過主圖的 1/4
+            wm_w, wm_h = size = _watermark_size(wm)
+            max_w = base_w / 4
+            max_h = base_h / 4
+
+            if wm_w > max_w or wm_h > max_h:
+                wm_scale = min(max_w / wm_w, max_h / wm_h)
+                size = (int(wm_w * wm_scale), int(wm_h * wm_scale))
+
+            # 圖片位置偏移，避免與文字重疊
+            pos, size = _scaled_box((x + 50, y + 50), size, scale)
+            sprite = watermark_sprite(wm, size, a)
+            elements.append(compositor.sprite_element(sprite, pos))
+            log("成功", "已套用圖片浮水印")
+        except Exception as e:
+            log("警告", f"圖片浮水印處理失敗: {str(e)}")
+
+    # 套用 QR code，放在右下角
+    if text:
+        try:
+            qr_size = fs * 3
+            qr_pos = (base_w - qr_size - 20, base_h - qr_size - 20)
+            qr_pos, (qr_size, _) = _scaled_box(qr_pos, (qr_size, qr_size), scale)
+            qr = qrcode_sprite(text, qr_size, a, params.qr_error_correction)
+            elements.append(compositor.sprite_element(qr, qr_pos))
+            log("成功", "已套用QR碼浮水印")
+        except Exception as e:
+            log("警告", f"QR碼處理失敗: {str(e)}")
+
+    return compositor.Layer(elements, False, (0, 0, 0, 0))
+
+
+# 依浮水印種類取得圖層函式，分塊處理大型圖片時使用
+WATERMARK_LAYERS = {"text": text_layer, "qrcode": qrcode_layer, "image": image_layer, "all": all_layer}
+
+
+def _render_layer(image, layer_fn, params, wm=None, log=None, full_size=None):
+    """傳入 full_size 時 image 視為原圖的縮小代理；只在各元素外框範圍內合成，回傳 (新的 RGB 陣列, 改動範圍)"""
+    scale, base_size = _proxy_scale(image, full_size)
+    layer = layer_fn(params, base_size, wm, log, scale)
+    return compositor.apply_layer(image.copy(), layer), compositor.layer_bbox(layer, image.shape[1], image.shape[0])
+
+
+def render_watermark(image, op, params, wm=None, log=None, full_size=None):
+    """套用 WATERMARK_LAYERS 中指定種類的浮水印，回傳 (新的 RGB 陣列, 改動範圍)；
+    改動範圍為 image 座標的 (x0, y0, x1, y1)，沒有繪製任何元素時為 None，供預覽只重算變動的區域"""
+    return _render_layer(image, WATERMARK_LAYERS[op], params, wm, log, full_size)
+
+
+def apply_text_watermark(image, params, log=None, full_size=None):
+    """在 RGB 陣列上套用文字浮水印，回傳新的 RGB 陣列"""
+    return _render_layer(image, text_layer, params, None, log, full_size)[0]
+
+
+def apply_qrcode_watermark(image, params, full_size=None):
+    """在右下角套用 QR code 浮水印，回傳新的 RGB 陣列"""
+    return _render_layer(image, qrcode_layer, params, None, None, full_size)[0]
+
+
+def apply_image_watermark(image, wm, params, log=None, full_size=None):
+    """在 (x, y) 套用圖片浮水印，必要時依主圖尺寸縮放，回傳新的 RGB 陣列"""
+    return _render_layer(image, image_layer, params, wm, log, full_size)[0]
+
+
+def apply_all_watermarks(image, params, wm=None, log=None, full_size=None):
+    """一次套用文字、圖片與 QR code 浮水印，回傳新的 RGB 陣列"""
+    return _render_layer(image, all_layer, params, wm, log, full_size)[0]
+
+
+def render_batch_watermark(img, params, font, wm=None):
+    """批次模式：文字放在 (x, y)，圖片浮水印距右下角 (x, y)，QR code 在左下角，回傳 RGB 圖片"""
+    # 含透明度的圖片需以 RGBA 合成，其餘直接在 RGB 緩衝區上處理
+    has_alpha = "A" in img.getbands() or "transparency" in img.info
+    buf = np.array(img.convert("RGBA" if has_alpha else "RGB"))
+    img_height, img_width = buf.shape[:2]
+    x, y, a = params.x, params.y, params.alpha
+    text = params.text.strip()
+    elements = []
+
+    # 套用文字浮水印
+    if text:
+        elements.append(compositor.text_element((x, y), text, font, tuple(params.color) + (a,)))
+
+    # 套用圖片浮水印
+    if wm:
+        # 確保浮水印不會超過原圖大小的1/4
+        wm_width, wm_height = new_size = _watermark_size(wm)
+        max_wm_width = img_width // 4
+        max_wm_height = img_height // 4
+
+        if wm_width > max_wm_width or wm_height > max_wm_height:
+            scale = min(max_wm_width / wm_width, max_wm_height / wm_height)
+            new_size = (int(wm_width * scale), int(wm_height * scale))
+
+        # 縮放並限制透明度，相同尺寸的結果由快取重複使用
+        resized_wm = watermark_sprite(wm, new_size, a, clamp_alpha)
+
+        # 計算貼上位置（右下角），並確保不會超出圖片範圍
+        paste_x = img_width - resized_wm.width - x
+        paste_y = img_height - resized_wm.height - y
+        paste_x = max(0, min(paste_x, img_width - resized_wm.width))
+        paste_y = max(0, min(paste_y, img_height - resized_wm.height))
+
+        elements.append(compositor.sprite_element(resized_wm, (paste_x, paste_y)))
+
+    # 套用 QR code，放在左下角以免與右下角的圖片浮水印重疊
+    if text and params.add_qrcode:
+        qr = qrcode_sprite(text, params.font_size * 3, a, params.qr_error_correction)
+        elements.append(compositor.sprite_element(qr, (20, img_height - qr.height - 20)))
+
+    # 只在各元素外框範圍內合併原圖和浮水印
+    compositor.composite_elements(buf, elements)
+    return Image.fromarray(buf).convert("RGB")
+
+
+def check_aes_key(key):
+    """檢查 AES 密鑰長度並轉為位元組"""
+    if len(key) != 16:
+        raise ValueError("請輸入長度為16的加密密鑰")
+    return key.encode('utf-8')
+
+
+def decrypt_bytes(payload, key):
+    """解密舊版以 AES-ECB 加密的位元組"""
+    cipher = AES.new(check_aes_key(key), AES.MODE_ECB)
+    return unpad(cipher.decrypt(payload), AES.block_size)
+
+
+def decrypt_text(payload, key):
+    """解密舊版以 base64 編碼的加密文字"""
+    msg = payload.decode('utf-8', errors='ignore')
+    return decrypt_bytes(base64.b64decode(msg), key).decode('utf-8')
+
+
+def _compressed(data, compress):
+    return compress_payload(data) if compress else (CODEC_NONE, bytes(data))
+
+
+def lsb_text_size(text, compress=True):
+    """回傳 (原文位元組數, 壓縮並加密後的位元組數)，用於估算有效容量"""
+    raw = text.encode('utf-8')
+    _, data = _compressed(raw, compress)
+    return len(raw), stream_cipher.encrypted_size(len(data))
+
+
+def lsb_text_payload(text, key, carrier, compress=True, depth=1):
+    """先壓縮再以 AES-GCM 加密文字，回傳 (資料, 旗標, 壓縮格式)；資料為 StreamPayload，嵌入時才逐塊加密。
+    超過載體在 depth 下的容量時丟出 ValueError，carrier 只需有 size 屬性"""
+    key = check_aes_key(key)
+    codec, data = _compressed(text.encode('utf-8'), compress)
+    nonce = stream_cipher.new_nonce()
+    payload = StreamPayload(stream_cipher.encrypted_size(len(data)),
+                            lambda: stream_cipher.encrypt_chunks(data, key, nonce))
+    max_bytes = capacity_bytes(carrier, depth)
+    if len(payload) > max_bytes:
+        raise ValueError(f"訊息過長，最大可嵌入約 {max_bytes} bytes，目前需要 {len(payload)} bytes")
+    return payload, FLAG_ENCRYPTED | FLAG_BINARY | FLAG_AEAD, codec
+
+
+def embed_lsb_text(carrier, text, key, compress=True, depth=1, scatter=False):
+    """將加密文字嵌入載體，scatter 時依密鑰分散寫入位置；回傳 (新影像, 使用 bytes, 可用 bytes)"""
+    payload, flags, codec = lsb_text_payload(text, key, carrier, compress, depth)
+    img = embed_container(carrier, payload, flags, codec, depth, check_aes_key(key) if scatter else None)
+    return img, len(payload), capacity_bytes(carrier, depth)
+
+
+def shrink_lsb_watermark(carrier, wm_img, depth=1):
+    """將浮水印縮小到約載體 90% 容量，過小時回傳 None"""
+    wm_h, wm_w = wm_img.shape[:2]
+    target_size = (capacity_bits(carrier, depth) - HEADER_BITS) // 10  # 預留空間，只使用90%容量
+    scale_factor = (target_size / wm_img.size) ** 0.5  # 平方根，因為縮放同時影響寬高
+
+    new_width = int(wm_w * scale_factor)
+    new_height = int(wm_h * scale_factor)
+    if new_width < 10 or new_height < 10:
+        return None
+    return cv2.resize(wm_img, (new_width, new_height), interpolation=cv2.INTER_AREA)
+
+
+def encode_lsb_image(wm_img, compress=True):
+    """將浮水印圖片編碼為 PNG 位元組，直接以位元陣列嵌入而不經 base64；回傳 (資料, 旗標, 壓縮格式)"""
+    ok, buffer = cv2.imencode('.png', wm_img)
+    if not ok:
+        raise ValueError("無法將浮水印編碼為 PNG")
+    codec, data = _compressed(buffer, compress)
+    return data, FLAG_IMAGE | FLAG_BINARY, codec
+
+
+def lsb_image_payload(wm_img, carrier, compress=True, depth=1):
+    """同 encode_lsb_image，超過載體在 depth 下的容量時丟出 ValueError"""
+    data, flags, codec = encode_lsb_image(wm_img, compress)
+    if len(data) > capacity_bytes(carrier, depth):
+        raise ValueError("即使縮放後，浮水印仍然太大")
+    return data, flags, codec
+
+
+def embed_lsb_image(carrier, wm_img, compress=True, depth=1, key=None):
+    """將浮水印圖片以 PNG 編碼後嵌入載體，指定 key 時依密鑰分散寫入位置；回傳 (新影像, 使用 bytes, 可用 bytes)"""
+    data, flags, codec = lsb_image_payload(wm_img, carrier, compress, depth)
+    img = embed_container(carrier, data, flags, codec, depth, check_aes_key(key) if key is not None else None)
+    return img, len(data), capacity_bytes(carrier, depth)
+
+
+def decode_lsb_text(header, payload, key):
+    """解密 extract_payload 取出的文字資料"""
+    if header is not None and header.flags & FLAG_IMAGE:
+        raise ValueError("此圖片嵌入的是圖片資料，請使用「讀出圖片LSB」")
+    # 舊版圖片與未標記 FLAG_BINARY 的資料為 base64 文字
+    if header is None or not header.flags & FLAG_BINARY:
+        return decrypt_text(payload, key)
+    # 以 lsb_text_decoder 讀取時已邊讀邊解密，標頭不再帶有 FLAG_ENCRYPTED
+    if header.flags & FLAG_AEAD:
+        payload = stream_cipher.decrypt(payload, check_aes_key(key))
+    elif header.flags & FLAG_ENCRYPTED:
+        payload = decrypt_bytes(payload, key)
+    return decompress_payload(header.codec, payload).decode('utf-8')
+
+
+def lsb_text_decoder(key):
+    """供 extract_payload 使用的解碼器：AES-GCM 文字資料邊讀邊解密，密鑰錯誤時讀完前置資料即失敗"""
+    key = check_aes_key(key)
+
+    def decoder(header):
+        if header.flags & FLAG_AEAD:
+            return stream_cipher.StreamDecryptor(key)
+        return None
+    return decoder
+
+
+def decode_lsb_image(header, payload):
+    """解碼 extract_payload 取出的圖片資料，回傳 (PNG 位元組, BGR 影像)"""
+    # 舊版圖片與未標記 FLAG_BINARY 的資料為 base64 文字
+    binary = header is not None and header.flags & FLAG_BINARY
+    decoded = payload if binary else base64.b64decode(payload)
+    if header is not None:
+        decoded = decompress_payload(header.codec, decoded)
+    extracted = cv2.imdecode(np.frombuffer(decoded, np.uint8), cv2.IMREAD_COLOR)
+    if extracted is None:
+        raise ValueError("無法解碼圖片資料")
+    return decoded, extracted
+
+
+def extract_lsb_text(img, key, progress=None, cancel=None):
+    """從載體讀出並解密文字，找不到資料時回傳 None"""
+    found = extract_payload(img, progress=progress, cancel=cancel, decoder=lsb_text_decoder(key),
+                            scatter_key=check_aes_key(key))
+    if found is None:
+        return None
+    return decode_lsb_text(*found, key)
+
+
+def extract_lsb_image(img, progress=None, cancel=None, key=None):
+    """從載體讀出嵌入的圖片，回傳 (PNG 位元組, BGR 影像)；找不到資料時回傳 None，分散嵌入的圖片需要 key"""
+    scatter_key = check_aes_key(key) if key is not None else None
+    found = extract_payload(img, progress=progress, cancel=cancel, scatter_key=scatter_key)
+    if found is None:
+        return None
+    return decode_lsb_image(*found)